@@ -0,0 +1,470 @@
+import asyncio
+import concurrent.futures
+import hashlib
+import os
+import ssl
+import threading
+import time
+from urllib.parse import urljoin, urlsplit
+
+from requests.structures import CaseInsensitiveDict
+
+from giphy_engine import (
+    MEDIA_HEADERS,
+    PART_SUFFIX,
+    GiphyEngine,
+    IncompleteDownloadError,
+    backoff_delay,
+)
+
+# asyncio下载引擎：搜索仍由原有的限速线程完成（每秒只有几个请求），
+# 媒体传输改为单线程事件循环中的大量协程，适合同时进行数百个小文件的传输。
+
+CHUNK_SIZE = 64 * 1024
+REDIRECT_STATUSES = (301, 302, 303, 307, 308)
+MAX_REDIRECTS = 5  # 与浏览器相比很保守，媒体CDN通常最多跳转一两次
+
+
+class HttpStatusError(IOError):
+    """服务器返回了错误状态码"""
+
+    def __init__(self, status, url):
+        super().__init__(f"{status} Error for url: {url}")
+        self.status = status
+
+
+def update_digest(digest, path):
+    """把已有文件的内容计入哈希（在线程池中运行，读大文件时不阻塞事件循环）"""
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+
+
+def is_retryable(error):
+    """与线程引擎相同的重试规则：网络错误、超时、不完整传输以及408/429/5xx"""
+    if isinstance(error, HttpStatusError):
+        return error.status in (408, 429) or error.status >= 500
+    return isinstance(error, (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, IncompleteDownloadError))
+
+
+class AsyncResponse:
+    """流式读取的HTTP响应，读完后连接交还给连接池复用"""
+
+    def __init__(self, client, key, reader, writer, status_code, headers, elapsed):
+        self.client = client
+        self.key = key
+        self.reader = reader
+        self.writer = writer
+        self.status_code = status_code
+        self.headers = headers
+        self.elapsed = elapsed
+        self.finished = False
+
+    async def iter_content(self, chunk_size=CHUNK_SIZE):
+        """逐块返回响应体，支持Content-Length、chunked和读到连接关闭三种格式"""
+        timeout = self.client.read_timeout
+        if self.headers.get('Transfer-Encoding', '').lower() == 'chunked':
+            while True:
+                line = await asyncio.wait_for(self.reader.readline(), timeout)
+                size = int(line.split(b';', 1)[0].strip() or b'0', 16)
+                if size == 0:
+                    # 跳过trailer直到空行
+                    while (await asyncio.wait_for(self.reader.readline(), timeout)).strip():
+                        pass
+                    break
+                remaining = size
+                while remaining:
+                    chunk = await asyncio.wait_for(self.reader.read(min(chunk_size, remaining)), timeout)
+                    if not chunk:
+                        raise asyncio.IncompleteReadError(b'', remaining)
+                    remaining -= len(chunk)
+                    yield chunk
+                await asyncio.wait_for(self.reader.readexactly(2), timeout)
+        elif self.headers.get('Content-Length', '').isdigit():
+            remaining = int(self.headers['Content-Length'])
+            while remaining:
+                chunk = await asyncio.wait_for(self.reader.read(min(chunk_size, remaining)), timeout)
+                if not chunk:
+                    # 连接提前关闭，由调用方按大小不一致处理
+                    self.close()
+                    return
+                remaining -= len(chunk)
+                yield chunk
+        else:
+            while True:
+                chunk = await asyncio.wait_for(self.reader.read(chunk_size), timeout)
+                if not chunk:
+                    break
+                yield chunk
+            self.close()
+            return
+        self.finished = True
+
+    async def read(self):
+        return b''.join([chunk async for chunk in self.iter_content()])
+
+    def close(self):
+        """释放连接：完整读完且允许keep-alive时放回连接池，否则关闭"""
+        if self.writer is None:
+            return
+        if self.finished and self.headers.get('Connection', '').lower() != 'close':
+            self.client.release(self.key, self.reader, self.writer)
+        else:
+            self.writer.close()
+        self.writer = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.close()
+
+
+class AsyncHttpClient:
+    """基于asyncio流的最小HTTP/1.1客户端：只支持GET，按主机复用keep-alive连接"""
+
+    def __init__(self, connect_timeout=10.0, read_timeout=30.0, on_connect=None):
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.on_connect = on_connect
+        self.idle = {}
+        self.stats = {}
+        self.ssl_context = ssl.create_default_context()
+
+    def release(self, key, reader, writer):
+        self.idle.setdefault(key, []).append((reader, writer))
+
+    def count(self, host, name):
+        host_stats = self.stats.setdefault(host, {'requests': 0, 'new_connections': 0})
+        host_stats[name] += 1
+
+    async def connect(self, key):
+        """取一个空闲连接，没有时新建；返回 (reader, writer, 是否复用)"""
+        idle = self.idle.get(key)
+        while idle:
+            reader, writer = idle.pop()
+            if not writer.is_closing() and not reader.at_eof():
+                return reader, writer, True
+            writer.close()
+        scheme, host, port = key
+        started = time.perf_counter()
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(
+                host, port,
+                ssl=self.ssl_context if scheme == 'https' else None,
+                server_hostname=host if scheme == 'https' else None,
+                limit=CHUNK_SIZE * 4
+            ),
+            self.connect_timeout
+        )
+        if self.on_connect:
+            self.on_connect(time.perf_counter() - started)
+        self.count(host, 'new_connections')
+        return reader, writer, False
+
+    async def get(self, url, headers=None, max_redirects=MAX_REDIRECTS):
+        """发送GET请求并读取响应头，跟随最多max_redirects次重定向；响应体需通过返回对象的 iter_content() 读取
+
+        超过跳转次数时返回最后一个3xx响应，由调用方按错误状态处理。
+        """
+        for _ in range(max_redirects):
+            response = await self.send(url, headers)
+            location = response.headers.get('Location')
+            if response.status_code not in REDIRECT_STATUSES or not location:
+                return response
+            # 重定向的响应体不需要，直接关闭连接
+            response.close()
+            url = urljoin(url, location)
+        return await self.send(url, headers)
+
+    async def send(self, url, headers=None):
+        """发送一次GET请求并读取响应头，不处理重定向"""
+        parts = urlsplit(url)
+        scheme = parts.scheme or 'http'
+        port = parts.port or (443 if scheme == 'https' else 80)
+        key = (scheme, parts.hostname, port)
+        target = parts.path or '/'
+        if parts.query:
+            target += '?' + parts.query
+        host_header = parts.hostname if parts.port is None else f"{parts.hostname}:{parts.port}"
+        lines = [f"GET {target} HTTP/1.1", f"Host: {host_header}", "User-Agent: giphy-downloader"]
+        lines += [f"{name}: {value}" for name, value in (headers or {}).items()]
+        request = ("\r\n".join(lines) + "\r\n\r\n").encode('latin-1')
+
+        while True:
+            reader, writer, reused = await self.connect(key)
+            started = time.perf_counter()
+            try:
+                writer.write(request)
+                await writer.drain()
+                head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), self.read_timeout)
+            except (OSError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, asyncio.TimeoutError):
+                writer.close()
+                if reused:
+                    # 服务器已关闭空闲连接，换一个新连接重发
+                    continue
+                raise
+            break
+
+        self.count(parts.hostname, 'requests')
+        status_line, *header_lines = head.decode('latin-1').split("\r\n")
+        response_headers = CaseInsensitiveDict()
+        for line in header_lines:
+            if ':' in line:
+                name, value = line.split(':', 1)
+                response_headers[name.strip()] = value.strip()
+        status_code = int(status_line.split()[1])
+        return AsyncResponse(
+            self, key, reader, writer, status_code, response_headers, time.perf_counter() - started
+        )
+
+    def connection_stats(self):
+        """返回 {主机: {'requests', 'new_connections', 'reused'}}"""
+        stats = {host: dict(values) for host, values in self.stats.items()}
+        for host_stats in stats.values():
+            host_stats['reused'] = max(0, host_stats['requests'] - host_stats['new_connections'])
+        return stats
+
+    def close(self):
+        for connections in self.idle.values():
+            for _, writer in connections:
+                writer.close()
+        self.idle.clear()
+
+
+class AsyncGiphyEngine(GiphyEngine):
+    """用asyncio传输媒体文件的引擎，构造参数、回调、cancel() 和返回值与 GiphyEngine 相同
+
+    同时进行的传输数由 async_concurrency 设置决定，不受线程引擎并发上限的限制。
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.async_http = None
+        self.transfer_stats = {}
+
+    def start_workers(self, scheduler, final_pass=False):
+        """在一个线程中运行事件循环，由它完成本轮所有传输"""
+        thread = threading.Thread(
+            target=self.profiled(lambda: asyncio.run(self.transfer_all(scheduler, final_pass))),
+            daemon=True
+        )
+        thread.start()
+        return [thread]
+
+    async def transfer_all(self, scheduler, final_pass):
+        """从调度器按轮询顺序取条目，交给固定数量的协程并发下载"""
+        transfers = max(1, int(self.settings['async_concurrency']))
+        queue = asyncio.Queue(maxsize=transfers)
+        loop = asyncio.get_running_loop()
+        pump_done = threading.Event()
+
+        def pump():
+            # 调度器的 get() 会阻塞，因此在线程中取条目再送入事件循环的队列
+            try:
+                while True:
+                    entry = scheduler.get(lambda: self.is_downloading)
+                    if entry is None:
+                        return
+                    future = asyncio.run_coroutine_threadsafe(queue.put(entry), loop)
+                    while True:
+                        try:
+                            future.result(0.2)
+                            break
+                        except concurrent.futures.TimeoutError:
+                            if not self.is_downloading:
+                                future.cancel()
+                                return
+            finally:
+                pump_done.set()
+
+        async def worker():
+            while self.is_downloading:
+                try:
+                    entry = await asyncio.wait_for(queue.get(), 0.2)
+                except asyncio.TimeoutError:
+                    if pump_done.is_set() and queue.empty():
+                        return
+                    continue
+                job, record = entry
+                status = await self.download_item_async(record, job, final_pass)
+                await loop.run_in_executor(None, self.settle_entry, entry, status)
+
+        self.async_http = AsyncHttpClient(
+            float(self.settings['connect_timeout']),
+            float(self.settings['read_timeout']),
+            on_connect=lambda seconds: self.metrics.record('connect', seconds)
+        )
+        try:
+            pumping = loop.run_in_executor(None, pump)
+            await asyncio.gather(*(worker() for _ in range(transfers)))
+            await pumping
+        finally:
+            for host, stats in self.async_http.connection_stats().items():
+                totals = self.transfer_stats.setdefault(host, {'requests': 0, 'new_connections': 0, 'reused': 0})
+                for name, value in stats.items():
+                    totals[name] += value
+            self.async_http.close()
+            self.async_http = None
+
+    async def download_item_async(self, record, job, final_pass=False):
+        """download_item 的协程版本；查询索引、校验哈希、去重和写索引会阻塞，放到线程池中执行"""
+        filepath = self.item_path(record, job)
+        if not filepath:
+            return 'failed'
+        loop = asyncio.get_running_loop()
+        if await loop.run_in_executor(
+            None, self.index.is_complete, record.id, job['quality_key'], filepath, self.settings['verify_hash']
+        ):
+            return 'skipped'
+
+        started = time.perf_counter()
+        status, result = await self.download_with_retries_async(record.url, filepath, final_pass)
+        if status == 'downloaded':
+            await loop.run_in_executor(
+                None, self.complete_item, record, job, filepath, result, time.perf_counter() - started
+            )
+        return status
+
+    async def sleep_while_downloading_async(self, seconds):
+        deadline = time.monotonic() + seconds
+        while self.is_downloading and time.monotonic() < deadline:
+            await asyncio.sleep(min(0.2, deadline - time.monotonic()))
+
+    async def throttle_async(self):
+        """throttle 的协程版本：等待全局带宽令牌补足"""
+        started = time.perf_counter()
+        while self.is_downloading:
+            wait = self.bandwidth.pending()
+            if not wait:
+                break
+            await asyncio.sleep(min(wait, 0.2))
+        self.metrics.record('bandwidth_wait', time.perf_counter() - started)
+
+    async def download_with_retries_async(self, url, filepath, final_pass):
+        """download_with_retries 的协程版本，重试、退避与熔断规则相同"""
+        host = urlsplit(url).netloc
+        breaker = self.breakers.get(host)
+        filename = os.path.basename(filepath)
+        max_retries = int(self.settings['media_max_retries'])
+        base = float(self.settings['media_backoff_base'])
+        maximum = float(self.settings['media_backoff_max'])
+
+        attempt = 0
+        while self.is_downloading:
+            if not breaker.allow():
+                if not final_pass:
+                    return 'deferred', None
+                await self.sleep_while_downloading_async(breaker.retry_in())
+                continue
+
+            try:
+                result = await self.download_file_async(url, filepath)
+            except Exception as e:
+                if not is_retryable(e):
+                    breaker.record_success()
+                    self.log_message(f"❌ 下载失败 {filename}: {str(e)}")
+                    return 'failed', None
+                if breaker.record_failure():
+                    self.log_message(f"🚫 {host} 连续失败，暂停使用 {breaker.cooldown:.0f} 秒")
+                if attempt >= max_retries:
+                    if final_pass:
+                        self.log_message(f"❌ 下载失败 {filename}: {str(e) or type(e).__name__}")
+                        return 'failed', None
+                    return 'deferred', None
+                await self.sleep_while_downloading_async(backoff_delay(attempt, base, maximum))
+                attempt += 1
+                continue
+
+            if result is None:
+                return 'failed', None
+            breaker.record_success()
+            return 'downloaded', result
+
+        return 'failed', None
+
+    async def download_file_async(self, url, filepath):
+        """download_file 的协程版本：同样写入 .part 文件、支持Range续传并校验大小"""
+        part_path = filepath + PART_SUFFIX
+        resume_from = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        headers = dict(MEDIA_HEADERS)
+        if resume_from:
+            headers['Range'] = f"bytes={resume_from}-"
+
+        response = await self.async_http.get(url, headers)
+        content_range = response.headers.get('Content-Range', '')
+        resumed = resume_from and response.status_code == 206 and content_range.startswith(f"bytes {resume_from}-")
+        if response.status_code == 416 or (response.status_code == 206 and not resumed):
+            # 已有的部分文件与服务器上的不一致，或返回的范围不是请求的位置：从头下载
+            response.close()
+            resume_from = 0
+            response = await self.async_http.get(url, MEDIA_HEADERS)
+
+        async with response:
+            # 只接受完整内容（200）或与续传位置一致的部分内容（206），3xx等响应体不能当作媒体保存
+            if response.status_code != 200 and not resumed:
+                raise HttpStatusError(response.status_code, url)
+            self.metrics.record('ttfb', response.elapsed)
+
+            loop = asyncio.get_running_loop()
+            digest = hashlib.sha256()
+            expected_size = None
+            if resumed:
+                await loop.run_in_executor(None, update_digest, digest, part_path)
+                total = content_range.rpartition('/')[2]
+                if total.isdigit():
+                    expected_size = int(total)
+            else:
+                resume_from = 0
+                if response.headers.get('Content-Length', '').isdigit():
+                    expected_size = int(response.headers['Content-Length'])
+
+            size = resume_from
+            transfer_started = time.perf_counter()
+            # 与线程引擎共用后台写盘线程；缓冲区满时在线程池中等待，不阻塞事件循环
+            handle = self.writer.open(part_path, resume_from, expected_size)
+            try:
+                async for chunk in response.iter_content(handle.chunk_size):
+                    if not self.is_downloading:
+                        await self.abort_handle(handle)
+                        return None
+                    if not handle.write(chunk, block=False):
+                        await loop.run_in_executor(None, handle.flush)
+                    size += len(chunk)
+                    digest.update(chunk)
+                    if self.bandwidth.consume(len(chunk)):
+                        await self.throttle_async()
+            except BaseException:
+                # 等写盘线程关闭文件后再重试，保证 .part 的大小与已写入的数据一致
+                await self.abort_handle(handle)
+                raise
+            self.metrics.record('transfer', time.perf_counter() - transfer_started)
+            self.metrics.add('bytes', size - resume_from)
+
+        if expected_size is not None and size != expected_size:
+            await self.abort_handle(handle)
+            raise IncompleteDownloadError(f"文件不完整 ({size}/{expected_size} 字节)")
+
+        await self.commit_handle(handle, filepath)
+        return size, digest.hexdigest()
+
+    async def commit_handle(self, handle, filepath):
+        """handle.commit 的协程版本：剩余数据在线程池中交给写盘线程（缓冲区满时会等待），事件循环只等待改名完成"""
+        await asyncio.get_running_loop().run_in_executor(None, handle.flush)
+        await asyncio.wrap_future(handle.commit(filepath))
+
+    async def abort_handle(self, handle):
+        """handle.abort 的协程版本，同样不在事件循环中等待缓冲区"""
+        if not handle.error:
+            await asyncio.get_running_loop().run_in_executor(None, handle.flush)
+        await asyncio.wait([asyncio.wrap_future(handle.abort())])
+
+    def finish_download(self):
+        """在线程引擎的收尾之外，输出异步传输的连接复用统计"""
+        for host, stats in sorted(self.transfer_stats.items()):
+            self.log_message(
+                f"⚡ {host}: 异步请求 {stats['requests']} 次, "
+                f"新建连接 {stats['new_connections']} 次, 复用 {stats['reused']} 次"
+            )
+        self.transfer_stats = {}
+        super().finish_download()
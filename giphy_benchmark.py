@@ -0,0 +1,404 @@
+import argparse
+import http.server
+import json
+import math
+import multiprocessing
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import zlib
+from urllib.parse import parse_qs, urlparse
+
+# 离线性能测试：本地模拟GIPHY搜索接口与媒体CDN，分别测量搜索和下载路径的吞吐量。
+# 只依赖标准库和 giphy_engine，不访问真实的API。
+
+BENCHMARK_API_KEY = "benchmark"
+MOCK_RENDITIONS = {
+    # 渲染版本: (宽, 高, 相对原图的面积比例)
+    'original': (480, 270, 1.0),
+    'downsized': (480, 270, 0.6),
+    'fixed_height': (356, 200, 0.55),
+    'fixed_width_small': (100, 56, 0.05),
+    # 与真实响应一样包含单帧静态图（只有GIF格式），用来确认最小画质不会选中它们
+    'original_still': (480, 270, 0.03),
+    'fixed_height_still': (356, 200, 0.02),
+}
+MOCK_FORMAT_RATIOS = {'gif': 1.0, 'mp4': 0.12, 'webp': 0.2}
+CHUNK_SIZE = 64 * 1024
+
+
+def mock_media_size(item_id, rendition, fmt, mean_kb):
+    """按条目id确定性地生成媒体大小：原图GIF大小服从对数正态分布，其他版本按面积和格式缩小"""
+    rng = random.Random(zlib.crc32(item_id.encode()))
+    original = mean_kb * 1024 * math.exp(rng.gauss(0, 0.6) - 0.18)
+    return max(1024, int(original * MOCK_RENDITIONS[rendition][2] * MOCK_FORMAT_RATIOS[fmt]))
+
+
+class MockGiphyServer(http.server.ThreadingHTTPServer):
+    """本地模拟的GIPHY服务器：搜索分页、限速、延迟、带宽、错误率均可配置"""
+
+    daemon_threads = True
+
+    def __init__(self, items=500, latency=0.0, bandwidth=0, error_rate=0.0, rate_limit=0, media_kb=500):
+        super().__init__(('127.0.0.1', 0), MockGiphyHandler)
+        self.items = items
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.error_rate = error_rate
+        self.rate_limit = rate_limit
+        self.media_kb = media_kb
+        self.lock = threading.Lock()
+        self.tokens = float(rate_limit)
+        self.refilled_at = time.monotonic()
+        self.counters = {'search': 0, 'lookup': 0, 'media': 0, 'rate_limited': 0, 'errors': 0, 'bytes': 0}
+        self.first_byte = {}
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}/"
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def count(self, name, value=1):
+        with self.lock:
+            self.counters[name] += value
+
+    def mark_first_byte(self, kind):
+        """记录每类响应第一次开始发送数据的时间（墙上时钟，可与子进程比较）"""
+        with self.lock:
+            self.first_byte.setdefault(kind, time.time())
+
+    def take_token(self):
+        """按rate_limit（请求/秒）限速，超出时返回False"""
+        if not self.rate_limit:
+            return True
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.rate_limit, self.tokens + (now - self.refilled_at) * self.rate_limit)
+            self.refilled_at = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return True
+            return False
+
+    def search_page(self, content_type, query, offset, limit):
+        """生成一页搜索结果，条目结构与GIPHY接口一致"""
+        username = query.lstrip('@')
+        count = max(0, min(limit, self.items - offset))
+        data = [self.mock_item(content_type, username, offset + i) for i in range(count)]
+        return {
+            'data': data,
+            'pagination': {'total_count': self.items, 'count': count, 'offset': offset},
+            'meta': {'status': 200, 'msg': 'OK'}
+        }
+
+    def lookup_items(self, ids):
+        """按id批量查询：id格式为 类型首字母+用户名+6位序号，序号超出条目数的视为已删除"""
+        data = []
+        for item_id in ids:
+            content_type = {'g': 'gifs', 's': 'stickers'}.get(item_id[:1])
+            index = item_id[-6:]
+            if content_type and index.isdigit() and int(index) < self.items:
+                data.append(self.mock_item(content_type, item_id[1:-6], int(index)))
+        return {'data': data, 'pagination': {'total_count': len(data), 'count': len(data), 'offset': 0},
+                'meta': {'status': 200, 'msg': 'OK'}}
+
+    def mock_item(self, content_type, username, index):
+        item_id = f"{content_type[0]}{username}{index:06d}"
+        images = {}
+        for rendition, (width, height, _) in MOCK_RENDITIONS.items():
+            base = f"{self.base_url}media/{item_id}/{rendition}"
+            images[rendition] = {
+                'width': str(width),
+                'height': str(height),
+                'url': f"{base}.gif",
+                'size': str(mock_media_size(item_id, rendition, 'gif', self.media_kb)),
+            }
+            if rendition.endswith('_still'):
+                continue
+            images[rendition].update({
+                'mp4': f"{base}.mp4",
+                'mp4_size': str(mock_media_size(item_id, rendition, 'mp4', self.media_kb)),
+                'webp': f"{base}.webp",
+                'webp_size': str(mock_media_size(item_id, rendition, 'webp', self.media_kb)),
+            })
+        return {
+            'type': 'gif',
+            'id': item_id,
+            'title': f"{username} {index}",
+            'username': username,
+            'rating': 'g',
+            'images': images,
+            'user': {'username': username, 'display_name': username, 'profile_url': f"https://giphy.com/{username}/"},
+        }
+
+
+class MockGiphyHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_status(self, code, headers=None):
+        self.send_response(code)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def do_GET(self):
+        server = self.server
+        if server.latency:
+            time.sleep(server.latency)
+        url = urlparse(self.path)
+        parts = url.path.strip('/').split('/')
+
+        if len(parts) == 3 and parts[0] == 'v1' and parts[2] == 'search':
+            server.count('search')
+            if not server.take_token():
+                server.count('rate_limited')
+                return self.send_status(429, {'Retry-After': '1'})
+            if random.random() < server.error_rate:
+                server.count('errors')
+                return self.send_status(503)
+            query = parse_qs(url.query)
+            offset = int(query.get('offset', ['0'])[0])
+            limit = int(query.get('limit', ['25'])[0])
+            if offset > 4999:
+                return self.send_status(400)
+            body = json.dumps(server.search_page(parts[1], query.get('q', [''])[0], offset, limit)).encode()
+            server.mark_first_byte('search')
+            return self.send_body(body, 'application/json')
+
+        if len(parts) == 2 and parts[0] == 'v1' and parts[1] == 'gifs':
+            server.count('lookup')
+            if not server.take_token():
+                server.count('rate_limited')
+                return self.send_status(429, {'Retry-After': '1'})
+            query = parse_qs(url.query)
+            ids = [item_id for item_id in query.get('ids', [''])[0].split(',') if item_id]
+            if not ids or len(ids) > 100:
+                return self.send_status(400)
+            body = json.dumps(server.lookup_items(ids)).encode()
+            server.mark_first_byte('lookup')
+            return self.send_body(body, 'application/json')
+
+        if len(parts) == 3 and parts[0] == 'media':
+            server.count('media')
+            if random.random() < server.error_rate:
+                server.count('errors')
+                return self.send_status(503)
+            rendition, _, fmt = parts[2].partition('.')
+            if rendition not in MOCK_RENDITIONS or fmt not in MOCK_FORMAT_RATIOS:
+                return self.send_status(404)
+            size = mock_media_size(parts[1], rendition, fmt, server.media_kb)
+            return self.send_media(size, fmt)
+
+        self.send_status(404)
+
+    def send_body(self, body, content_type):
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.write_throttled(body)
+
+    def send_media(self, size, fmt):
+        """发送指定大小的合成媒体数据，支持Range续传"""
+        start = 0
+        range_header = self.headers.get('Range', '')
+        if range_header.startswith('bytes=') and range_header[6:].rstrip('-').isdigit():
+            start = int(range_header[6:].rstrip('-'))
+            if start >= size:
+                return self.send_status(416, {'Content-Range': f"bytes */{size}"})
+            self.send_response(206)
+            self.send_header('Content-Range', f"bytes {start}-{size - 1}/{size}")
+        else:
+            self.send_response(200)
+        self.send_header('Content-Type', 'video/mp4' if fmt == 'mp4' else f"image/{fmt}")
+        self.send_header('Content-Length', str(size - start))
+        self.end_headers()
+        self.server.mark_first_byte('media')
+        block = bytes(CHUNK_SIZE)
+        remaining = size - start
+        while remaining > 0:
+            chunk = block[:min(CHUNK_SIZE, remaining)]
+            self.write_throttled(chunk)
+            remaining -= len(chunk)
+
+    def write_throttled(self, data):
+        """按每个连接的带宽上限（字节/秒）写出数据"""
+        server = self.server
+        for index in range(0, len(data), CHUNK_SIZE):
+            chunk = data[index:index + CHUNK_SIZE]
+            self.wfile.write(chunk)
+            server.count('bytes', len(chunk))
+            if server.bandwidth:
+                time.sleep(len(chunk) / server.bandwidth)
+
+
+def peak_rss_mb():
+    """当前进程的峰值常驻内存（MB），不支持的平台返回None"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux上单位为KB，macOS上为字节
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def directory_size(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            if not name.startswith('.giphy_index'):
+                total += os.path.getsize(os.path.join(root, name))
+    return total
+
+
+def run_phase(phase, base_url, usernames, options):
+    """在独立进程中运行一个测试阶段，返回测量结果（峰值内存只包含该阶段）"""
+    from giphy_engine import CONTENT_TYPES, GiphyEngine
+
+    engine_class = GiphyEngine
+    if options['engine'] == 'asyncio':
+        from giphy_async import AsyncGiphyEngine
+
+        engine_class = AsyncGiphyEngine
+    settings = {
+        'api_base': base_url,
+        'cache_ttl': 0,
+        'api_rate': options['api_rate'],
+        'search_concurrency': options['search_concurrency'],
+        'async_concurrency': options['concurrency'],
+    }
+    engine = engine_class(BENCHMARK_API_KEY, settings, options['concurrency'])
+    result = {'phase': phase, 'started_at': time.time()}
+    started = time.perf_counter()
+
+    if phase == 'search':
+        items = 0
+        for username in usernames:
+            content = engine.list_user_content(username, CONTENT_TYPES)
+            items += sum(len(found) for found in content.values())
+        result['items'] = items
+        result['bytes'] = 0
+    elif phase == 'refresh':
+        # 先完整下载一遍（不计时），再测量按id批量核对所有已下载条目的耗时
+        download_dir = tempfile.mkdtemp(prefix="giphy_benchmark_")
+        try:
+            engine.run_batch(usernames, download_dir, options['quality'])
+            started = time.perf_counter()
+            result['started_at'] = time.time()
+            stats = engine.run_batch(usernames, download_dir, options['quality'], refresh=True)
+            result['items'] = sum(job['checked'] for job in stats.values())
+            result['changed'] = sum(job['changed'] for job in stats.values())
+            result['bytes'] = 0
+        finally:
+            shutil.rmtree(download_dir, ignore_errors=True)
+    else:
+        download_dir = tempfile.mkdtemp(prefix="giphy_benchmark_")
+        try:
+            stats = engine.run_batch(usernames, download_dir, options['quality'])
+            result['items'] = sum(job['downloaded'] for job in stats.values())
+            result['failed'] = sum(job['failed'] for job in stats.values())
+            result['bytes'] = directory_size(download_dir)
+        finally:
+            shutil.rmtree(download_dir, ignore_errors=True)
+
+    elapsed = time.perf_counter() - started
+    result['seconds'] = elapsed
+    result['items_per_sec'] = result['items'] / elapsed if elapsed else 0
+    result['mb_per_sec'] = result['bytes'] / elapsed / (1024 * 1024) if elapsed else 0
+    result['peak_rss_mb'] = peak_rss_mb()
+    return result
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="giphy_benchmark",
+        description="离线性能测试：用本地模拟的GIPHY服务器测量搜索与下载的吞吐量"
+    )
+    parser.add_argument('--users', type=int, default=2, help="模拟的作者数量（默认2）")
+    parser.add_argument('--items', type=int, default=300, help="每个作者每种类型的条目数（默认300，上限5000）")
+    parser.add_argument('--media-kb', type=int, default=300, help="原图GIF的平均大小（KB，默认300）")
+    parser.add_argument('--latency', type=float, default=20, help="每个请求的额外延迟（毫秒，默认20）")
+    parser.add_argument('--bandwidth', type=float, default=0, help="每个连接的带宽上限（KB/秒，默认不限）")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="请求随机返回503的比例（默认0）")
+    parser.add_argument('--rate-limit', type=float, default=0, help="搜索接口每秒允许的请求数，超出返回429（默认不限）")
+    parser.add_argument('--api-rate', type=float, default=50.0, help="客户端的API限速（请求/秒，默认50）")
+    parser.add_argument('-j', '--concurrency', type=int, default=8, help="并发下载数（默认8）")
+    parser.add_argument('--engine', choices=('threads', 'asyncio'), default='threads', help="下载引擎（默认threads）")
+    parser.add_argument('--search-concurrency', type=int, default=4, help="并发搜索请求数（默认4）")
+    parser.add_argument('-q', '--quality', default="Original", help="画质（默认Original）")
+    parser.add_argument(
+        '--phases', nargs='+', choices=('search', 'download', 'refresh'), default=['search', 'download'],
+        help="要运行的测试阶段（默认search和download；refresh先下载再测量按id批量核对）"
+    )
+    parser.add_argument('--json', help="把结果另外写入JSON文件")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    server = MockGiphyServer(
+        items=min(args.items, 5000),
+        latency=args.latency / 1000,
+        bandwidth=args.bandwidth * 1024,
+        error_rate=args.error_rate,
+        rate_limit=args.rate_limit,
+        media_kb=args.media_kb,
+    ).start()
+    usernames = [f"bench{index}" for index in range(args.users)]
+    options = {
+        'concurrency': args.concurrency,
+        'search_concurrency': args.search_concurrency,
+        'api_rate': args.api_rate,
+        'quality': args.quality,
+        'engine': args.engine,
+    }
+
+    print(f"🧪 模拟服务器: {server.base_url}  作者 {args.users} 个 × 每种类型 {server.items} 个条目")
+    results = []
+    # 每个阶段在全新的子进程中运行，峰值内存互不影响
+    context = multiprocessing.get_context('spawn')
+    try:
+        for phase in args.phases:
+            server.first_byte.clear()
+            with context.Pool(1) as pool:
+                result = pool.apply(run_phase, (phase, server.base_url, usernames, options))
+            first_byte = server.first_byte.get({'search': 'search', 'refresh': 'lookup'}.get(phase, 'media'))
+            result['ttfb_sec'] = first_byte - result['started_at'] if first_byte else None
+            results.append(result)
+            ttfb = f"{result['ttfb_sec'] * 1000:.0f} ms" if result['ttfb_sec'] is not None else "-"
+            rss = f"{result['peak_rss_mb']:.1f} MB" if result['peak_rss_mb'] is not None else "-"
+            print(
+                f"📊 {phase:<8} 条目 {result['items']:>6}  耗时 {result['seconds']:.2f}s  "
+                f"{result['items_per_sec']:.1f} 条/秒  {result['mb_per_sec']:.2f} MB/秒  "
+                f"首字节 {ttfb}  峰值内存 {rss}"
+            )
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    print(
+        f"🌐 服务器: 搜索请求 {server.counters['search']} 次, 按id查询 {server.counters['lookup']} 次, "
+        f"媒体请求 {server.counters['media']} 次, "
+        f"429 {server.counters['rate_limited']} 次, 注入错误 {server.counters['errors']} 次, "
+        f"发送 {server.counters['bytes'] / (1024 * 1024):.1f} MB"
+    )
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'options': vars(args), 'results': results, 'server': server.counters}, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,2407 @@
+import requests
+from requests.adapters import HTTPAdapter
+import os
+import json
+import sqlite3
+import hashlib
+import zlib
+import threading
+import queue
+import heapq
+import itertools
+from collections import deque
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from urllib.parse import urlparse
+import time
+import random
+
+# 并发下载线程数的默认值与上下限
+DEFAULT_CONCURRENCY = 4
+MIN_CONCURRENCY = 1
+MAX_CONCURRENCY = 32
+
+# 画质选项映射
+QUALITY_MAPPING = {
+    "Original": "original",
+    "High": "fixed_height",
+    "Medium": "downsized",
+    "Small": "fixed_width_small",
+    # 不固定渲染版本：在满足尺寸要求的GIF/MP4/WebP中选字节数最少的
+    "Smallest": "smallest"
+}
+
+# 每个渲染版本中各格式的URL字段与大小字段
+RENDITION_FORMATS = (('gif', 'url', 'size'), ('mp4', 'mp4', 'mp4_size'), ('webp', 'webp', 'webp_size'))
+
+# 兼容旧配置文件中的中文画质选项
+LEGACY_QUALITY_LABELS = {
+    '高清': 'Original',
+    '标准': 'High',
+    '压缩': 'Medium',
+    '小图': 'Small'
+}
+
+CONTENT_TYPES = ('gifs', 'stickers')
+
+# 配置文件路径，图形界面和命令行共用
+CONFIG_FILE = os.path.join(os.path.expanduser("~"), ".giphy_downloader_config.json")
+
+# 搜索接口响应缓存，与下载目录无关
+CACHE_FILE = os.path.join(os.path.expanduser("~"), ".giphy_downloader_cache.sqlite3")
+
+# 高级设置（仅通过配置文件调整）的默认值
+DEFAULT_SETTINGS = {
+    'pool_maxsize': 0,        # 每个主机保持的最大连接数，0表示跟随并发数
+    'pool_hosts': 10,         # 同时缓存连接池的主机数量
+    'connect_timeout': 10,    # 建立连接超时（秒）
+    'read_timeout': 30,       # 读取超时（秒）
+    'search_concurrency': 4,  # 搜索分页同时进行的最大请求数
+    'queue_size': 200,        # 搜索与下载之间缓冲队列的容量
+    'verify_hash': False,     # 跳过已下载文件前是否重新校验SHA-256
+    'api_rate': 4.0,          # 每个API密钥每秒最多请求数（收到429时自动下调）
+    'api_max_retries': 5,     # API请求被限流或临时失败时的最大重试次数
+    'api_backoff_base': 1.0,  # 重试退避的初始等待（秒），之后按指数增长
+    'api_backoff_max': 60.0,  # 单次重试等待的上限（秒）
+    'media_max_retries': 3,   # 媒体文件暂时失败时的立即重试次数
+    'media_backoff_base': 0.5,
+    'media_backoff_max': 30.0,
+    'breaker_threshold': 5,   # 同一主机连续失败多少次后熔断
+    'breaker_cooldown': 30.0, # 熔断后暂停使用该主机的时间（秒）
+    'log_max_lines': 2000,    # 日志框最多保留的行数，超出后丢弃最早的行
+    'cache_ttl': 0,           # 搜索结果缓存的有效期（秒），0表示不使用缓存；增量同步总会向服务器确认
+    'cache_max_mb': 64,       # 搜索结果缓存的最大体积，超出后淘汰最久未使用的条目
+    'min_width': 0,           # Smallest画质要求的最小宽度，0表示与原图相同
+    'min_height': 0,          # Smallest画质要求的最小高度，0表示与原图相同
+    'max_file_mb': 0,         # Smallest画质的单文件大小上限，0表示不限制
+    'api_base': "https://api.giphy.com/",  # API地址，测试时可指向本地模拟服务器
+    'metrics_path': "",       # 非空时任务结束后导出耗时统计（.prom为Prometheus文本格式，其他为JSON）
+    'profile_path': "",       # 非空时对整个任务做cProfile性能分析并保存到该文件
+    'dedup': "hardlink",      # 内容相同的文件: hardlink硬链接、reflink写时复制（不支持时退回硬链接）、off保留副本
+    'postprocess': "",        # 逗号分隔的后处理: thumbnail缩略图、webp把GIF转为WebP、metadata记录帧数和时长；留空不处理
+    'thumbnail_size': 160,    # 缩略图的最长边（像素）
+    'postprocess_workers': 0, # 后处理进程数，0表示CPU核数
+    'async_concurrency': 128, # asyncio引擎同时进行的传输数
+    'gallery_cache_mb': 64,   # 图形界面预览区缩略图缓存的内存上限
+    'write_threads': 2,       # 后台写盘线程数
+    'write_buffer_mb': 16,    # 等待写盘的数据上限，写盘跟不上时下载暂停
+    'write_chunk_kb': 1024,   # 单次写盘的最大块大小，实际大小按文件大小自适应
+    'preallocate': True,      # 按已知文件大小预先分配磁盘空间
+    'fsync': "never",         # 刷盘策略: file每个文件完成时、batch任务结束时统一、never交给操作系统
+    'bandwidth_mb': 0,        # 所有下载共用的带宽上限（MB/秒），0表示不限速，运行中可在界面调整
+    'schedule': "fifo",       # 下载顺序: fifo按发现顺序、smallest小文件优先、largest大文件优先（在每个用户的缓冲队列内排序）
+}
+
+GIPHY_API_PREFIX = DEFAULT_SETTINGS['api_base']
+SEARCH_PAGE_LIMIT = 50
+GIPHY_MAX_SEARCH_OFFSET = 4999  # 搜索接口允许的最大offset
+REFRESH_BATCH_SIZE = 100  # 按id批量查询接口每次最多查询的条目数
+INDEX_FILENAME = ".giphy_index.sqlite3"
+THUMBNAIL_DIRNAME = ".thumbnails"
+POSTPROCESS_TASKS = ('thumbnail', 'webp', 'metadata')
+FSYNC_POLICIES = ('file', 'batch', 'never')
+SCHEDULE_POLICIES = ('fifo', 'smallest', 'largest')
+PART_SUFFIX = ".part"
+
+# 媒体文件本身已压缩，禁用传输压缩以便Content-Length与Range按原始字节计算
+MEDIA_HEADERS = {'Accept-Encoding': 'identity'}
+
+
+def read_config():
+    """读取配置文件，不存在或损坏时返回空字典"""
+    try:
+        if os.path.exists(CONFIG_FILE):
+            with open(CONFIG_FILE, 'r', encoding='utf-8') as f:
+                return json.load(f)
+    except Exception as e:
+        print(f"配置文件加载失败: {e}")
+    return {}
+
+
+def write_config(config):
+    """保存配置到文件"""
+    try:
+        with open(CONFIG_FILE, 'w', encoding='utf-8') as f:
+            json.dump(config, f, indent=2, ensure_ascii=False)
+    except Exception as e:
+        print(f"配置文件保存失败: {e}")
+
+
+def settings_from_config(config):
+    """从配置中取出高级设置，缺失的项使用默认值"""
+    return {key: config.get(key, value) for key, value in DEFAULT_SETTINGS.items()}
+
+
+def normalize_quality(label):
+    """把配置中的画质名称（包括旧版中文名称）转换为当前的选项"""
+    label = LEGACY_QUALITY_LABELS.get(label, label)
+    return label if label in QUALITY_MAPPING else "Original"
+
+
+def parse_usernames(text):
+    """把用逗号、空白或换行分隔的用户名拆成列表，忽略#开头的注释行和开头的@，保持顺序去重"""
+    names = []
+    for line in text.splitlines():
+        line = line.split('#', 1)[0]
+        names.extend(name.strip().lstrip('@') for name in line.replace(',', ' ').split())
+    return list(dict.fromkeys(name for name in names if name))
+
+
+def clamp_concurrency(value):
+    """将并发数限制在允许范围内"""
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        value = DEFAULT_CONCURRENCY
+    return max(MIN_CONCURRENCY, min(MAX_CONCURRENCY, value))
+
+
+class CountingHTTPAdapter(HTTPAdapter):
+    """记录各主机新建连接与请求次数的HTTP适配器"""
+
+    def __init__(self, *args, on_connect=None, **kwargs):
+        # 被淘汰的连接池的统计数据，按主机累计
+        self.retired_stats = {}
+        self.stats_lock = threading.Lock()
+        # 每次建立新连接（DNS解析、TCP与TLS握手）后以耗时秒数调用
+        self.on_connect = on_connect
+        super().__init__(*args, **kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            scheme: self.timed_pool_class(pool_class)
+            for scheme, pool_class in self.poolmanager.pool_classes_by_scheme.items()
+        }
+        pools = self.poolmanager.pools
+        dispose = pools.dispose_func
+
+        def retire(pool):
+            self.add_pool_stats(self.retired_stats, pool)
+            if dispose:
+                dispose(pool)
+
+        pools.dispose_func = retire
+
+    def timed_pool_class(self, pool_class):
+        """返回一个连接池子类，其连接在建立时记录耗时"""
+        adapter = self
+
+        class TimedConnection(pool_class.ConnectionCls):
+            def connect(self):
+                started = time.perf_counter()
+                super().connect()
+                if adapter.on_connect:
+                    adapter.on_connect(time.perf_counter() - started)
+
+        return type(pool_class.__name__, (pool_class,), {'ConnectionCls': TimedConnection})
+
+    def add_pool_stats(self, stats, pool):
+        """把单个连接池的计数累加到stats中"""
+        with self.stats_lock:
+            host_stats = stats.setdefault(pool.host, {'requests': 0, 'new_connections': 0})
+            host_stats['requests'] += pool.num_requests
+            host_stats['new_connections'] += pool.num_connections
+
+    def connection_stats(self):
+        """返回 {主机: {'requests', 'new_connections', 'reused'}}"""
+        stats = {host: dict(values) for host, values in self.retired_stats.items()}
+        pools = self.poolmanager.pools
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is not None:
+                self.add_pool_stats(stats, pool)
+        for host_stats in stats.values():
+            host_stats['reused'] = max(0, host_stats['requests'] - host_stats['new_connections'])
+        return stats
+
+
+class HttpClient:
+    """共享的keep-alive HTTP会话，API与媒体CDN使用各自按主机划分的连接池"""
+
+    def __init__(self, concurrency, settings, metrics=None):
+        pool_maxsize = int(settings['pool_maxsize']) or concurrency
+        self.timeout = (float(settings['connect_timeout']), float(settings['read_timeout']))
+        on_connect = (lambda seconds: metrics.record('connect', seconds)) if metrics else None
+
+        self.session = requests.Session()
+        api_pool_maxsize = max(pool_maxsize, int(settings['search_concurrency']))
+        self.api_adapter = CountingHTTPAdapter(pool_connections=1, pool_maxsize=api_pool_maxsize, on_connect=on_connect)
+        self.media_adapter = CountingHTTPAdapter(
+            pool_connections=int(settings['pool_hosts']),
+            pool_maxsize=pool_maxsize,
+            on_connect=on_connect
+        )
+        # 更长的前缀优先匹配，因此API请求走独立的连接池
+        self.session.mount(settings.get('api_base') or GIPHY_API_PREFIX, self.api_adapter)
+        self.session.mount("https://", self.media_adapter)
+        self.session.mount("http://", self.media_adapter)
+
+    def get(self, url, **kwargs):
+        """发送GET请求，未指定时使用配置的超时"""
+        kwargs.setdefault('timeout', self.timeout)
+        return self.session.get(url, **kwargs)
+
+    def connection_stats(self):
+        """汇总所有连接池的复用统计"""
+        stats = self.api_adapter.connection_stats()
+        stats.update(self.media_adapter.connection_stats())
+        return stats
+
+    def close(self):
+        self.session.close()
+
+
+def backoff_delay(attempt, base, maximum):
+    """指数退避加全抖动：在 [0, min(maximum, base * 2^attempt)] 内随机取值"""
+    return random.uniform(0, min(maximum, base * (2 ** attempt)))
+
+
+def parse_retry_after(value):
+    """解析Retry-After头（秒数或HTTP日期），无法解析时返回None"""
+    from email.utils import parsedate_to_datetime
+
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class RateLimiter:
+    """令牌桶限速器：收到429时速率减半并暂停到Retry-After，之后随成功请求逐步恢复"""
+
+    def __init__(self, rate):
+        self.max_rate = max(0.1, rate)
+        self.rate = self.max_rate
+        self.capacity = max(1.0, self.max_rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.lock = threading.Lock()
+
+    def acquire(self, should_continue):
+        """取得一个令牌；等待期间 should_continue() 返回False时放弃并返回False"""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if now < self.blocked_until:
+                    wait = self.blocked_until - now
+                elif self.tokens >= 1:
+                    self.tokens -= 1
+                    return True
+                else:
+                    wait = (1 - self.tokens) / self.rate
+            if not should_continue():
+                return False
+            time.sleep(min(wait, 0.2))
+
+    def on_success(self):
+        """成功请求后线性恢复速率"""
+        with self.lock:
+            self.rate = min(self.max_rate, self.rate + self.max_rate * 0.05)
+
+    def on_throttled(self, delay):
+        """被限流：速率减半，清空令牌并在delay秒内暂停所有请求"""
+        with self.lock:
+            self.rate = max(self.max_rate * 0.05, self.rate / 2)
+            self.tokens = 0.0
+            self.blocked_until = max(self.blocked_until, time.monotonic() + delay)
+
+
+# 同一个API密钥的所有请求（包括并发分页）共享一个限速器
+_rate_limiters = {}
+_rate_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(api_key, rate):
+    """获取API密钥对应的限速器，配置的速率变化时重新创建"""
+    with _rate_limiters_lock:
+        limiter = _rate_limiters.get(api_key)
+        if limiter is None or limiter.max_rate != max(0.1, rate):
+            limiter = _rate_limiters[api_key] = RateLimiter(rate)
+        return limiter
+
+
+class BandwidthLimiter:
+    """所有下载共用的带宽令牌桶（字节/秒），rate为0表示不限速，运行中可随时调整
+
+    先按收到的字节数扣除令牌，令牌为负时由下载线程等待补足，因此单个大块不会超出长期平均速率。
+    """
+
+    BURST_SECONDS = 0.5  # 空闲后最多积攒的流量（按秒计）
+
+    def __init__(self, rate=0):
+        self.lock = threading.Lock()
+        self.rate = 0.0
+        self.tokens = 0.0
+        self.updated = time.monotonic()
+        self.set_rate(rate)
+
+    def set_rate(self, rate):
+        """修改速率，对正在进行的下载立即生效"""
+        with self.lock:
+            self.refill()
+            self.rate = max(0.0, float(rate))
+            self.tokens = min(self.tokens, self.rate * self.BURST_SECONDS)
+
+    def refill(self):
+        now = time.monotonic()
+        if self.rate:
+            self.tokens = min(self.rate * self.BURST_SECONDS, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def consume(self, size):
+        """扣除size字节的令牌，返回需要等待的秒数"""
+        with self.lock:
+            if not self.rate:
+                return 0.0
+            self.refill()
+            self.tokens -= size
+            return self.wait_time()
+
+    def pending(self):
+        """仍需等待的秒数：令牌补足到非负为止；速率变化后按新速率重新计算"""
+        with self.lock:
+            if not self.rate:
+                self.tokens = 0.0
+                return 0.0
+            self.refill()
+            return self.wait_time()
+
+    def wait_time(self):
+        return max(0.0, -self.tokens / self.rate)
+
+
+def schedule_key(policy):
+    """下载顺序对应的排序键（作用于 (任务, ItemRecord) 条目），fifo返回None；大小未知的条目排在最后"""
+    if policy == "smallest":
+        return lambda entry: entry[1].size or float('inf')
+    if policy == "largest":
+        return lambda entry: -entry[1].size
+    return None
+
+
+class IncompleteDownloadError(IOError):
+    """收到的字节数与服务器声明的大小不一致"""
+
+
+def is_retryable_error(error):
+    """判断媒体下载错误是否值得重试：网络错误、超时、不完整传输以及408/429/5xx"""
+    if isinstance(error, requests.exceptions.HTTPError):
+        status = error.response.status_code if error.response is not None else 0
+        return status in (408, 429) or status >= 500
+    return isinstance(error, (requests.exceptions.RequestException, IncompleteDownloadError))
+
+
+class CircuitBreaker:
+    """单个主机的熔断器：连续失败达到阈值后在冷却期内拒绝请求，冷却后只放行一个试探请求"""
+
+    def __init__(self, threshold, cooldown):
+        self.threshold = max(1, threshold)
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+        self.lock = threading.Lock()
+
+    def allow(self):
+        """当前是否可以向该主机发送请求"""
+        with self.lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at >= self.cooldown and not self.trial_in_flight:
+                self.trial_in_flight = True
+                return True
+            return False
+
+    def retry_in(self):
+        """距离冷却结束的秒数"""
+        with self.lock:
+            if self.opened_at is None:
+                return 0.0
+            return max(0.2, self.opened_at + self.cooldown - time.monotonic())
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_in_flight = False
+
+    def record_failure(self):
+        """记录一次失败，刚刚触发熔断时返回True"""
+        with self.lock:
+            self.failures += 1
+            was_trial = self.trial_in_flight
+            self.trial_in_flight = False
+            if was_trial or (self.opened_at is None and self.failures >= self.threshold):
+                self.opened_at = time.monotonic()
+                return True
+            return False
+
+
+class HostCircuitBreakers:
+    """按主机名惰性创建熔断器"""
+
+    def __init__(self, threshold, cooldown):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.breakers = {}
+        self.lock = threading.Lock()
+
+    def get(self, host):
+        with self.lock:
+            breaker = self.breakers.get(host)
+            if breaker is None:
+                breaker = self.breakers[host] = CircuitBreaker(self.threshold, self.cooldown)
+            return breaker
+
+
+class FairScheduler:
+    """多个来源共用的下载队列：每个来源一个子队列，取条目时在来源之间轮询
+
+    put() 在该来源的子队列满时阻塞；get() 在所有来源都已结束且队列清空后返回None。
+    limit 为None时子队列不限长度。给出key时子队列按 key(条目) 从小到大取出，相同时保持放入顺序。
+    """
+
+    def __init__(self, limit, key=None):
+        self.limit = limit
+        self.key = key
+        self.counter = itertools.count()
+        self.queues = {}
+        self.order = deque()
+        self.open_sources = set()
+        self.cond = threading.Condition()
+
+    def add_source(self, source):
+        with self.cond:
+            key = id(source)
+            self.queues[key] = [] if self.key else deque()
+            self.order.append(key)
+            self.open_sources.add(key)
+
+    def finish_source(self, source):
+        """来源不会再有新条目"""
+        with self.cond:
+            self.open_sources.discard(id(source))
+            self.cond.notify_all()
+
+    def put(self, source, entry, should_continue):
+        """放入条目；等待期间 should_continue() 返回False时放弃并返回False"""
+        with self.cond:
+            items = self.queues[id(source)]
+            while self.limit is not None and len(items) >= self.limit:
+                if not should_continue():
+                    return False
+                self.cond.wait(0.2)
+            if self.key:
+                heapq.heappush(items, (self.key(entry), next(self.counter), entry))
+            else:
+                items.append(entry)
+            self.cond.notify_all()
+            return True
+
+    def get(self, should_continue):
+        """按轮询顺序取出下一个条目，没有更多条目或被停止时返回None"""
+        with self.cond:
+            while True:
+                for _ in range(len(self.order)):
+                    key = self.order[0]
+                    self.order.rotate(-1)
+                    items = self.queues[key]
+                    if items:
+                        entry = heapq.heappop(items)[2] if self.key else items.popleft()
+                        self.cond.notify_all()
+                        return entry
+                    if key not in self.open_sources:
+                        # 已结束且清空的来源不再参与轮询
+                        self.order.remove(key)
+                if not self.open_sources or not should_continue():
+                    return None
+                self.cond.wait(0.2)
+
+
+class ResponseCache:
+    """持久化的搜索响应缓存（SQLite）：按TTL判断新鲜度，按体积做LRU淘汰，过期条目用于条件请求"""
+
+    def __init__(self, path, ttl, max_bytes):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.revalidated = 0
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        with self.lock:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute(
+                """CREATE TABLE IF NOT EXISTS search_cache (
+                    key TEXT PRIMARY KEY,
+                    body BLOB NOT NULL,
+                    etag TEXT,
+                    last_modified TEXT,
+                    fetched_at REAL NOT NULL,
+                    last_used REAL NOT NULL,
+                    size INTEGER NOT NULL
+                )"""
+            )
+            self.conn.commit()
+
+    def lookup(self, key):
+        """返回 (数据, 是否仍在有效期内, 条件请求头)，没有缓存时返回None"""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT body, etag, last_modified, fetched_at FROM search_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            self.conn.execute("UPDATE search_cache SET last_used = ? WHERE key = ?", (time.time(), key))
+            self.conn.commit()
+        data = json.loads(zlib.decompress(row[0]))
+        fresh = time.time() - row[3] < self.ttl
+        headers = {}
+        if row[1]:
+            headers['If-None-Match'] = row[1]
+        if row[2]:
+            headers['If-Modified-Since'] = row[2]
+        return data, fresh, headers
+
+    def refresh(self, key):
+        """服务器返回304时延长已有缓存的有效期"""
+        now = time.time()
+        with self.lock:
+            self.conn.execute(
+                "UPDATE search_cache SET fetched_at = ?, last_used = ? WHERE key = ?", (now, now, key)
+            )
+            self.conn.commit()
+
+    def store(self, key, content, etag=None, last_modified=None):
+        """保存一页原始响应，并淘汰超出体积上限的最久未使用条目"""
+        body = zlib.compress(content)
+        now = time.time()
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO search_cache VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, body, etag, last_modified, now, now, len(body))
+            )
+            self.conn.execute(
+                """DELETE FROM search_cache WHERE key IN (
+                    SELECT key FROM (
+                        SELECT key, SUM(size) OVER (ORDER BY last_used DESC) AS running FROM search_cache
+                    ) WHERE running > ?
+                )""",
+                (self.max_bytes,)
+            )
+            self.conn.commit()
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+def rendition_candidates(images):
+    """列出所有带大小信息的动画渲染版本，返回 [(字节数, 宽, 高, URL)]"""
+    candidates = []
+    for name, data in images.items():
+        # *_still 是只有一帧的静态图，尺寸与动画相同但小得多，不能作为候选
+        if not isinstance(data, dict) or name.endswith('_still'):
+            continue
+        try:
+            width, height = int(data.get('width') or 0), int(data.get('height') or 0)
+        except (TypeError, ValueError):
+            continue
+        for _, url_field, size_field in RENDITION_FORMATS:
+            url = data.get(url_field)
+            try:
+                size = int(data.get(size_field) or 0)
+            except (TypeError, ValueError):
+                continue
+            if url and size > 0:
+                candidates.append((size, width, height, url))
+    return candidates
+
+
+def pick_smallest_rendition(images, min_width=0, min_height=0, max_bytes=0):
+    """在满足最小尺寸（默认与原图相同）和大小上限的版本中选字节数最少的，返回 (URL, 字节数)
+
+    没有版本能同时满足时，优先选大小上限内分辨率最高的版本；没有大小信息时返回 (None, 0)。
+    """
+    candidates = rendition_candidates(images)
+    if not candidates:
+        return None, 0
+    original = images.get('original', {})
+    min_width = min_width or int(original.get('width') or 0)
+    min_height = min_height or int(original.get('height') or 0)
+
+    within_limit = [c for c in candidates if not max_bytes or c[0] <= max_bytes]
+    eligible = [c for c in within_limit if c[1] >= min_width and c[2] >= min_height]
+    if eligible:
+        size, _, _, url = min(eligible, key=lambda c: (c[0], -c[1] * c[2]))
+    else:
+        size, _, _, url = max(within_limit or candidates, key=lambda c: (c[1] * c[2], -c[0]))
+    return url, size
+
+
+def format_duration(seconds):
+    """把秒数格式化为 时:分:秒 或 分:秒"""
+    seconds = int(max(0, seconds))
+    hours, rest = divmod(seconds, 3600)
+    return f"{hours}:{rest // 60:02d}:{rest % 60:02d}" if hours else f"{rest // 60}:{rest % 60:02d}"
+
+
+class RunMetrics:
+    """一次任务的分阶段耗时与吞吐量统计，可导出为JSON或Prometheus文本格式"""
+
+    # 阶段名称及其中文说明，按请求的先后顺序排列
+    PHASES = {
+        'search_page': "搜索分页",
+        'rate_limit_wait': "限速等待",
+        'connect': "建立连接",
+        'ttfb': "首字节",
+        'transfer': "传输",
+        'bandwidth_wait': "带宽限速等待",
+        'disk_write': "写盘",
+    }
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = time.monotonic()
+        self.finished = None
+        self.spans = {}  # 阶段 -> [次数, 总耗时, 最长耗时]
+        self.counters = {'bytes': 0, 'files': 0, 'search_pages': 0}
+
+    def record(self, phase, seconds):
+        with self.lock:
+            span = self.spans.setdefault(phase, [0, 0.0, 0.0])
+            span[0] += 1
+            span[1] += seconds
+            span[2] = max(span[2], seconds)
+
+    def add(self, name, value=1):
+        with self.lock:
+            self.counters[name] += value
+
+    def finish(self):
+        self.finished = time.monotonic()
+
+    def elapsed(self):
+        return (self.finished or time.monotonic()) - self.started
+
+    def bytes_per_second(self):
+        elapsed = self.elapsed()
+        return self.counters['bytes'] / elapsed if elapsed > 0 else 0.0
+
+    def summary(self):
+        """汇总为可序列化的字典（各阶段耗时为所有线程累计的秒数）"""
+        with self.lock:
+            phases = {
+                phase: {'count': span[0], 'total_seconds': span[1], 'max_seconds': span[2]}
+                for phase, span in self.spans.items()
+            }
+            counters = dict(self.counters)
+        return dict(
+            counters,
+            elapsed_seconds=self.elapsed(),
+            bytes_per_second=self.bytes_per_second(),
+            phases=phases
+        )
+
+    def to_prometheus(self):
+        """Prometheus文本格式"""
+        summary = self.summary()
+        lines = [
+            "# HELP giphy_downloader_phase_seconds_total Time spent in each phase, summed over threads.",
+            "# TYPE giphy_downloader_phase_seconds_total counter",
+        ]
+        lines += [
+            f'giphy_downloader_phase_seconds_total{{phase="{phase}"}} {values["total_seconds"]:.6f}'
+            for phase, values in summary['phases'].items()
+        ]
+        lines += [
+            "# HELP giphy_downloader_phase_count_total Number of spans recorded for each phase.",
+            "# TYPE giphy_downloader_phase_count_total counter",
+        ]
+        lines += [
+            f'giphy_downloader_phase_count_total{{phase="{phase}"}} {values["count"]}'
+            for phase, values in summary['phases'].items()
+        ]
+        lines += [
+            "# HELP giphy_downloader_phase_max_seconds Longest single span of each phase.",
+            "# TYPE giphy_downloader_phase_max_seconds gauge",
+        ]
+        lines += [
+            f'giphy_downloader_phase_max_seconds{{phase="{phase}"}} {values["max_seconds"]:.6f}'
+            for phase, values in summary['phases'].items()
+        ]
+        for name, kind, help_text in (
+            ('bytes', 'counter', "Media bytes transferred."),
+            ('files', 'counter', "Media files downloaded."),
+            ('search_pages', 'counter', "Search pages fetched from the API."),
+        ):
+            lines += [
+                f"# HELP giphy_downloader_{name}_total {help_text}",
+                f"# TYPE giphy_downloader_{name}_total {kind}",
+                f"giphy_downloader_{name}_total {summary[name]}",
+            ]
+        lines += [
+            "# HELP giphy_downloader_run_seconds Wall-clock duration of the run.",
+            "# TYPE giphy_downloader_run_seconds gauge",
+            f"giphy_downloader_run_seconds {summary['elapsed_seconds']:.3f}",
+            "# HELP giphy_downloader_bytes_per_second Average media throughput of the run.",
+            "# TYPE giphy_downloader_bytes_per_second gauge",
+            f"giphy_downloader_bytes_per_second {summary['bytes_per_second']:.1f}",
+        ]
+        return "\n".join(lines) + "\n"
+
+    def export(self, path):
+        """按扩展名导出：.prom为Prometheus文本格式，其他为JSON"""
+        with open(path, 'w', encoding='utf-8') as f:
+            if path.endswith('.prom'):
+                f.write(self.to_prometheus())
+            else:
+                json.dump(self.summary(), f, ensure_ascii=False, indent=2)
+
+
+def url_format(url):
+    """按URL路径（不含查询参数）的扩展名判断格式，无法判断时按GIF处理"""
+    extension = os.path.splitext(urlparse(url).path)[1].lower().lstrip('.')
+    return extension if extension in ('mp4', 'webp') else 'gif'
+
+
+def rendition_info(images, url):
+    """返回与URL对应的渲染版本的 (格式, 字节数)，不在images中时按URL判断格式、字节数为0"""
+    for data in images.values():
+        if not isinstance(data, dict):
+            continue
+        for media_format, url_field, size_field in RENDITION_FORMATS:
+            if data.get(url_field) == url:
+                try:
+                    return media_format, int(data.get(size_field) or 0)
+                except (TypeError, ValueError):
+                    return media_format, 0
+    return url_format(url), 0
+
+
+class ItemRecord:
+    """下载一个条目所需的最少字段，解析搜索结果时提取，原始JSON随即丢弃"""
+
+    # format放在最后，旧日志中没有这一列的记录读取时为None
+    __slots__ = ('id', 'content_type', 'title', 'url', 'size', 'original_size', 'format')
+
+    def __init__(self, id, content_type, title, url, size=0, original_size=0, format=None):
+        self.id = id
+        self.content_type = content_type
+        self.title = title
+        self.url = url
+        self.size = size
+        self.original_size = original_size
+        self.format = format
+
+    def to_json(self):
+        return json.dumps([getattr(self, name) for name in self.__slots__])
+
+    @classmethod
+    def from_json(cls, text):
+        return cls(*json.loads(text))
+
+
+def format_bytes(size):
+    """把字节数格式化为便于阅读的字符串"""
+    for unit in ('B', 'KB', 'MB'):
+        if abs(size) < 1024:
+            return f"{size:.0f} {unit}" if unit == 'B' else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.2f} GB"
+
+
+# Linux上克隆文件数据的ioctl（btrfs、XFS等支持写时复制的文件系统）
+FICLONE = 0x40049409
+
+
+def reflink_file(source, target):
+    """用写时复制的方式创建target，文件系统或平台不支持时返回False"""
+    try:
+        import fcntl
+    except ImportError:
+        return False
+    try:
+        with open(source, 'rb') as src, open(target, 'wb') as dst:
+            fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+        return True
+    except OSError:
+        try:
+            os.remove(target)
+        except OSError:
+            pass
+        return False
+
+
+def link_duplicate(source, target, mode="hardlink"):
+    """把target替换为与source共享数据的链接，返回实际使用的方式，无法链接时返回None（保留原文件）"""
+    temp_path = target + ".link"
+    if os.path.exists(temp_path):
+        os.remove(temp_path)
+    if mode == "reflink" and reflink_file(source, temp_path):
+        os.replace(temp_path, target)
+        return "reflink"
+    try:
+        os.link(source, temp_path)
+    except OSError:
+        # 跨磁盘或文件系统不支持硬链接
+        return None
+    os.replace(temp_path, target)
+    return "hardlink"
+
+
+def process_media(path, thumbnail_path=None, thumbnail_size=160, webp_path=None, with_duration=False):
+    """在后处理进程中运行：读取尺寸和帧数，按需计算总时长、生成缩略图和WebP，返回结果字典"""
+    from PIL import Image
+
+    info = {}
+    with Image.open(path) as image:
+        info['width'], info['height'] = image.size
+        info['frames'] = getattr(image, 'n_frames', 1)
+        if with_duration:
+            duration = 0
+            for frame in range(info['frames']):
+                image.seek(frame)
+                duration += image.info.get('duration', 0)
+            info['duration_ms'] = duration
+            image.seek(0)
+        if thumbnail_path:
+            os.makedirs(os.path.dirname(thumbnail_path), exist_ok=True)
+            thumbnail = image.convert('RGBA')
+            thumbnail.thumbnail((thumbnail_size, thumbnail_size))
+            thumbnail.save(thumbnail_path, 'PNG')
+            info['thumbnail'] = thumbnail_path
+        if webp_path and image.format == 'GIF':
+            image.save(webp_path, 'WEBP', save_all=True)
+            info['webp'] = webp_path
+    return info
+
+
+class MediaPostProcessor:
+    """把下载完成的文件交给进程池做后处理，结果写入下载索引；提交不会阻塞下载线程"""
+
+    def __init__(self, index, tasks, thumbnail_size=160, workers=0, log=None):
+        self.index = index
+        self.tasks = set(tasks)
+        self.thumbnail_size = thumbnail_size
+        self.log = log or (lambda message: None)
+        self.lock = threading.Lock()
+        self.counts = {'submitted': 0, 'processed': 0, 'failed': 0}
+        self.closed = False
+        # 下载线程仍在运行，用spawn启动子进程以免fork时复制持有中的锁
+        self.executor = ProcessPoolExecutor(
+            max_workers=workers or None, mp_context=multiprocessing.get_context('spawn')
+        )
+
+    def submit(self, filepath):
+        """提交一个已下载的文件，MP4等PIL无法读取的格式直接忽略"""
+        if not filepath.endswith(('.gif', '.webp')):
+            return
+        relative = self.index.relative_path(filepath)
+        thumbnail_path = None
+        if 'thumbnail' in self.tasks:
+            thumbnail_path = os.path.join(self.index.root_dir, THUMBNAIL_DIRNAME, *f"{relative}.png".split('/'))
+        webp_path = None
+        if 'webp' in self.tasks and filepath.endswith('.gif'):
+            webp_path = os.path.splitext(filepath)[0] + '.webp'
+        future = self.executor.submit(
+            process_media, filepath, thumbnail_path, self.thumbnail_size, webp_path, 'metadata' in self.tasks
+        )
+        with self.lock:
+            self.counts['submitted'] += 1
+        future.add_done_callback(lambda done: self.on_done(filepath, done))
+
+    def on_done(self, filepath, future):
+        if future.cancelled():
+            return
+        try:
+            info = future.result()
+        except Exception as e:
+            with self.lock:
+                self.counts['failed'] += 1
+                first_failure = self.counts['failed'] == 1
+            if first_failure:
+                self.log(f"⚠️ 后处理失败: {os.path.basename(filepath)}: {str(e)}")
+            return
+        with self.lock:
+            # 任务被停止后仍在运行的子进程会晚于索引关闭完成，结果直接丢弃
+            if self.closed:
+                return
+            self.index.record_media(filepath, info)
+            self.counts['processed'] += 1
+
+    def close(self, wait=True):
+        """等待剩余的后处理完成；wait为False时取消尚未开始的任务，之后完成的结果不再写入索引"""
+        self.executor.shutdown(wait=wait, cancel_futures=not wait)
+        with self.lock:
+            self.closed = True
+            return dict(self.counts)
+
+
+def adaptive_chunk_size(expected_size, maximum):
+    """按文件大小选择读写块大小：小文件一次写完，大文件用大块减少系统调用"""
+    if not expected_size:
+        return min(256 * 1024, maximum)
+    size = 64 * 1024
+    while size < maximum and size * 8 < expected_size:
+        size *= 2
+    return min(size, maximum)
+
+
+def preallocate(fd, size):
+    """按已知大小预先分配磁盘空间，减少碎片；平台或文件系统不支持时忽略"""
+    if size <= 0 or not hasattr(os, 'posix_fallocate'):
+        return
+    try:
+        os.posix_fallocate(fd, 0, size)
+    except OSError:
+        pass
+
+
+def fsync_path(path):
+    """把文件或目录刷到磁盘，平台不支持（如Windows上的目录）时忽略"""
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+class WriteHandle:
+    """FileWriter 中一个正在写入的文件；数据先在本地攒成大块，再交给写盘线程"""
+
+    def __init__(self, writer, queue_, path, offset, expected_size, chunk_size):
+        self.writer = writer
+        self.queue = queue_
+        self.path = path
+        self.offset = offset
+        self.expected_size = expected_size
+        self.chunk_size = chunk_size
+        self.pending = bytearray()
+        self.file = None
+        self.error = None
+        self.done = Future()
+
+    def write(self, data, block=True):
+        """追加数据，攒够一块后放入写盘队列；block为False且缓冲区已满时返回False，数据留到下次提交"""
+        if self.error:
+            raise self.error
+        self.pending += data
+        if len(self.pending) < self.chunk_size:
+            return True
+        return self.writer.submit(self, block)
+
+    def flush(self):
+        """把攒下的数据放入写盘队列，缓冲区满时等待"""
+        self.writer.submit(self, True)
+
+    def commit(self, final_path):
+        """写完后改名为final_path，返回在落盘（按fsync策略）并改名后完成的Future"""
+        self.writer.submit(self, True)
+        self.queue.put((self, final_path))
+        return self.done
+
+    def abort(self):
+        """放弃写入：已收到的数据仍写入 .part 文件，供下次续传"""
+        if not self.error:
+            self.writer.submit(self, True)
+        self.queue.put((self, False))
+        return self.done
+
+
+class FileWriter:
+    """后台写盘：下载线程只把数据放入有界缓冲区，由写盘线程写入文件
+
+    同一个文件固定由一个写盘线程处理以保证顺序；缓冲区满时下载线程等待，内存占用有上限。
+    fsync 为 file 时每个文件改名前刷盘，batch 时在 close() 中统一刷盘，never 交给操作系统。
+    """
+
+    def __init__(self, threads=2, buffer_bytes=16 * 1024 * 1024, max_chunk=1024 * 1024, fsync="never",
+                 preallocate=True, metrics=None):
+        self.buffer_bytes = max(1, buffer_bytes)
+        self.max_chunk = max(4096, max_chunk)
+        self.fsync = fsync
+        self.preallocate = preallocate
+        self.metrics = metrics or RunMetrics()
+        self.buffered = 0
+        self.condition = threading.Condition()
+        self.written_paths = []  # fsync为batch时等待统一刷盘的文件
+        self.queues = [queue.SimpleQueue() for _ in range(max(1, threads))]
+        self.next_queue = 0
+        self.threads = [threading.Thread(target=self.run, args=(q,), daemon=True) for q in self.queues]
+        for thread in self.threads:
+            thread.start()
+
+    def open(self, path, offset=0, expected_size=None):
+        """开始写入path（offset为续传时已有的字节数），返回 WriteHandle"""
+        with self.condition:
+            queue_ = self.queues[self.next_queue % len(self.queues)]
+            self.next_queue += 1
+        return WriteHandle(self, queue_, path, offset, expected_size, adaptive_chunk_size(expected_size, self.max_chunk))
+
+    def submit(self, handle, block):
+        """把handle攒下的数据放入写盘队列，超出缓冲上限时等待写盘线程腾出空间"""
+        if not handle.pending:
+            return True
+        size = len(handle.pending)
+        with self.condition:
+            # 缓冲区为空时总是放行，避免单块大于上限时永远等待
+            while self.buffered and self.buffered + size > self.buffer_bytes:
+                if not block:
+                    return False
+                self.condition.wait()
+            self.buffered += size
+        data = bytes(handle.pending)
+        handle.pending.clear()
+        handle.queue.put((handle, data))
+        return True
+
+    def run(self, queue_):
+        """写盘线程：按顺序执行各文件的写入和收尾"""
+        while True:
+            item = queue_.get()
+            if item is None:
+                return
+            handle, data = item
+            if isinstance(data, bytes):
+                started = time.perf_counter()
+                try:
+                    if not handle.error:
+                        self.write(handle, data)
+                except OSError as e:
+                    handle.error = e
+                finally:
+                    self.metrics.record('disk_write', time.perf_counter() - started)
+                    with self.condition:
+                        self.buffered -= len(data)
+                        self.condition.notify_all()
+            else:
+                started = time.perf_counter()
+                try:
+                    self.finish(handle, data)
+                except OSError as e:
+                    handle.error = handle.error or e
+                self.metrics.record('disk_write', time.perf_counter() - started)
+                if handle.error:
+                    handle.done.set_exception(handle.error)
+                else:
+                    handle.done.set_result(handle.path)
+
+    def write(self, handle, data):
+        """在写盘线程中写入一块数据，第一次写入时打开文件"""
+        if handle.file is None:
+            self.open_file(handle)
+        handle.file.write(data)
+
+    def open_file(self, handle):
+        """打开 .part 文件：续传时从offset处接着写，并按完整大小预分配空间"""
+        handle.file = open(handle.path, 'r+b' if handle.offset else 'wb')
+        if handle.offset:
+            handle.file.truncate(handle.offset)
+            handle.file.seek(handle.offset)
+        if self.preallocate and handle.expected_size:
+            preallocate(handle.file.fileno(), handle.expected_size)
+
+    def finish(self, handle, final_path):
+        """关闭文件：截掉预分配后未写入的部分，按策略刷盘，final_path非空时改名"""
+        if handle.file is None:
+            if handle.error or not final_path:
+                return
+            self.open_file(handle)
+        with handle.file:
+            # 预分配的空间未写满（被停止或传输不完整）时，保持 .part 的大小等于已写入的字节数，以便续传
+            handle.file.truncate(handle.file.tell())
+            if handle.error or not final_path:
+                return
+            if self.fsync == "file":
+                handle.file.flush()
+                os.fsync(handle.file.fileno())
+        os.replace(handle.path, final_path)
+        handle.path = final_path
+        if self.fsync == "file":
+            fsync_path(os.path.dirname(final_path))
+        elif self.fsync == "batch":
+            with self.condition:
+                self.written_paths.append(final_path)
+
+    def close(self):
+        """等待队列中的数据全部写完；fsync为batch时把本次写入的文件及其目录刷盘"""
+        for queue_ in self.queues:
+            queue_.put(None)
+        for thread in self.threads:
+            thread.join()
+        if self.written_paths:
+            started = time.perf_counter()
+            for path in self.written_paths:
+                fsync_path(path)
+            for directory in {os.path.dirname(path) for path in self.written_paths}:
+                fsync_path(directory)
+            self.metrics.record('disk_write', time.perf_counter() - started)
+            self.written_paths = []
+
+
+def file_sha256(filepath):
+    """计算文件的SHA-256"""
+    digest = hashlib.sha256()
+    with open(filepath, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class DownloadIndex:
+    """保存在下载根目录中的SQLite索引，按 (条目id, 画质) 记录已完整下载的文件"""
+
+    def __init__(self, root_dir):
+        self.root_dir = root_dir
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(os.path.join(root_dir, INDEX_FILENAME), check_same_thread=False)
+        with self.lock:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute(
+                """CREATE TABLE IF NOT EXISTS downloads (
+                    item_id TEXT NOT NULL,
+                    rendition TEXT NOT NULL,
+                    path TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    sha256 TEXT NOT NULL,
+                    completed_at REAL NOT NULL,
+                    PRIMARY KEY (item_id, rendition)
+                )"""
+            )
+            self.conn.execute("CREATE INDEX IF NOT EXISTS downloads_sha256 ON downloads (sha256)")
+            # 后处理得到的媒体信息，缩略图与WebP路径同样相对于下载根目录
+            self.conn.execute(
+                """CREATE TABLE IF NOT EXISTS media_info (
+                    path TEXT PRIMARY KEY,
+                    width INTEGER,
+                    height INTEGER,
+                    frames INTEGER,
+                    duration_ms INTEGER,
+                    thumbnail TEXT,
+                    webp TEXT,
+                    processed_at REAL NOT NULL
+                )"""
+            )
+            self.conn.execute(
+                """CREATE TABLE IF NOT EXISTS seen_items (
+                    username TEXT NOT NULL,
+                    content_type TEXT NOT NULL,
+                    item_id TEXT NOT NULL,
+                    PRIMARY KEY (username, content_type, item_id)
+                )"""
+            )
+            # 任务日志：搜索到的条目边发现边写入，程序中断后可以不重新搜索直接继续下载
+            self.conn.execute(
+                """CREATE TABLE IF NOT EXISTS journal_searches (
+                    username TEXT NOT NULL,
+                    content_type TEXT NOT NULL,
+                    complete INTEGER NOT NULL,
+                    updated_at REAL NOT NULL,
+                    PRIMARY KEY (username, content_type)
+                )"""
+            )
+            self.conn.execute(
+                """CREATE TABLE IF NOT EXISTS journal_items (
+                    username TEXT NOT NULL,
+                    content_type TEXT NOT NULL,
+                    item_id TEXT NOT NULL,
+                    item TEXT NOT NULL,
+                    done INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY (username, content_type, item_id)
+                )"""
+            )
+            self.conn.commit()
+
+    def relative_path(self, filepath):
+        """索引中保存相对路径，移动整个下载目录后仍然有效"""
+        return os.path.relpath(filepath, self.root_dir).replace(os.sep, '/')
+
+    def is_complete(self, item_id, rendition, filepath, verify_hash=False):
+        """文件已记录在索引中且磁盘上的大小（可选哈希）一致时返回True"""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT path, size, sha256 FROM downloads WHERE item_id = ? AND rendition = ?",
+                (item_id, rendition)
+            ).fetchone()
+        if row is None or row[0] != self.relative_path(filepath):
+            return False
+        try:
+            if os.path.getsize(filepath) != row[1]:
+                return False
+            return not verify_hash or file_sha256(filepath) == row[2]
+        except OSError:
+            return False
+
+    def record(self, item_id, rendition, filepath, size, sha256):
+        """记录一个已完整下载的文件"""
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO downloads VALUES (?, ?, ?, ?, ?, ?)",
+                (item_id, rendition, self.relative_path(filepath), size, sha256, time.time())
+            )
+            self.conn.commit()
+
+    def forget(self, item_id, rendition):
+        """删除一条下载记录，之后该文件会被重新下载"""
+        with self.lock:
+            self.conn.execute("DELETE FROM downloads WHERE item_id = ? AND rendition = ?", (item_id, rendition))
+            self.conn.commit()
+
+    def downloaded_paths(self, directory, rendition):
+        """返回directory（相对于下载根目录）中以该画质下载的文件 {条目id: 绝对路径}"""
+        prefix = self.relative_path(directory) + '/'
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT item_id, path FROM downloads WHERE rendition = ? AND substr(path, 1, ?) = ?",
+                (rendition, len(prefix), prefix)
+            ).fetchall()
+        return {item_id: os.path.join(self.root_dir, *path.split('/')) for item_id, path in rows}
+
+    def find_duplicate(self, sha256, size, filepath):
+        """查找内容相同、仍完整存在于磁盘上的另一个已下载文件，返回其路径"""
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT path FROM downloads WHERE sha256 = ? AND size = ?", (sha256, size)
+            ).fetchall()
+        relative = self.relative_path(filepath)
+        for (path,) in rows:
+            if path == relative:
+                continue
+            candidate = os.path.join(self.root_dir, *path.split('/'))
+            try:
+                if os.path.getsize(candidate) == size:
+                    return candidate
+            except OSError:
+                continue
+        return None
+
+    def known_ids(self, username, content_type):
+        """返回增量同步中该用户该类型已处理过的条目id集合"""
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT item_id FROM seen_items WHERE username = ? AND content_type = ?",
+                (username.lower(), content_type)
+            ).fetchall()
+        return {row[0] for row in rows}
+
+    def mark_seen(self, username, content_type, item_id):
+        """记录已处理完成的条目（用于增量同步和任务日志）"""
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR IGNORE INTO seen_items VALUES (?, ?, ?)",
+                (username.lower(), content_type, item_id)
+            )
+            self.conn.execute(
+                "UPDATE journal_items SET done = 1 WHERE username = ? AND content_type = ? AND item_id = ?",
+                (username.lower(), content_type, item_id)
+            )
+            self.conn.commit()
+
+    def journal_begin(self, username, content_type):
+        """开始一次新的搜索，清空该用户该类型上一次的任务日志"""
+        with self.lock:
+            self.conn.execute(
+                "DELETE FROM journal_items WHERE username = ? AND content_type = ?", (username.lower(), content_type)
+            )
+            self.conn.execute(
+                "INSERT OR REPLACE INTO journal_searches VALUES (?, ?, 0, ?)",
+                (username.lower(), content_type, time.time())
+            )
+            self.conn.commit()
+
+    def journal_add(self, username, content_type, records):
+        """把新搜索到的一页条目写入任务日志"""
+        with self.lock:
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO journal_items (username, content_type, item_id, item) VALUES (?, ?, ?, ?)",
+                [(username.lower(), content_type, record.id, record.to_json()) for record in records]
+            )
+            self.conn.commit()
+
+    def journal_complete(self, username, content_type):
+        """标记搜索已完整结束，之后可以只凭任务日志继续下载"""
+        with self.lock:
+            self.conn.execute(
+                "UPDATE journal_searches SET complete = 1, updated_at = ? WHERE username = ? AND content_type = ?",
+                (time.time(), username.lower(), content_type)
+            )
+            self.conn.commit()
+
+    def record_media(self, filepath, info):
+        """保存后处理得到的尺寸、帧数、时长以及缩略图和WebP的位置"""
+        thumbnail = info.get('thumbnail')
+        webp = info.get('webp')
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO media_info VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    self.relative_path(filepath), info.get('width'), info.get('height'), info.get('frames'),
+                    info.get('duration_ms'), thumbnail and self.relative_path(thumbnail),
+                    webp and self.relative_path(webp), time.time()
+                )
+            )
+            self.conn.commit()
+
+    def journal_pending(self, username, content_type):
+        """返回任务日志中尚未完成的条目（按发现顺序）；没有完整的搜索记录时返回None"""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT complete FROM journal_searches WHERE username = ? AND content_type = ?",
+                (username.lower(), content_type)
+            ).fetchone()
+            if not row or not row[0]:
+                return None
+            rows = self.conn.execute(
+                "SELECT item FROM journal_items WHERE username = ? AND content_type = ? AND done = 0 ORDER BY rowid",
+                (username.lower(), content_type)
+            ).fetchall()
+        return [ItemRecord.from_json(row[0]) for row in rows]
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+
+class GiphyEngine:
+    """与界面无关的搜索/下载引擎，图形界面与命令行共用
+
+    log、status、progress、downloaded（参数为下载完成的文件路径）为可选回调，可能在后台线程中被调用；
+    调用 cancel() 或把 is_downloading 置为False即可停止正在进行的任务。
+    """
+
+    def __init__(self, api_key, settings=None, concurrency=DEFAULT_CONCURRENCY,
+                 log=None, status=None, progress=None, downloaded=None):
+        self.api_key = api_key
+        self.settings = dict(DEFAULT_SETTINGS, **(settings or {}))
+        self.concurrency = clamp_concurrency(concurrency)
+        self.log = log or (lambda message: None)
+        self.status = status or (lambda text: None)
+        self.progress = progress or (lambda value: None)
+        self.downloaded = downloaded or (lambda filepath: None)
+        self.http = None
+        self.index = None
+        self.breakers = None
+        self.search_executor = None
+        self.cache = None
+        self.metrics = RunMetrics()
+        self.profiles = None
+        self.postprocessor = None
+        self.writer = None
+        self.bandwidth = BandwidthLimiter(float(self.settings['bandwidth_mb']) * 1024 * 1024)
+        self.failed_pages = {}
+        self.progress_totals = {'found': 0, 'done': 0}
+        self.progress_lock = threading.Lock()
+        self.is_downloading = False
+
+    def log_message(self, message):
+        self.log(message)
+
+    def set_status(self, text):
+        self.status(text)
+
+    def set_progress(self, value):
+        self.progress(value)
+
+    def update_progress(self, done, total, title):
+        """更新进度和状态文字"""
+        if not self.is_downloading:
+            return
+        self.set_progress(done / total)
+        # 按已用时间估算整体速度和剩余时间
+        elapsed = self.metrics.elapsed()
+        speed = f"{format_bytes(self.metrics.bytes_per_second())}/s"
+        if done and elapsed > 0:
+            speed += f"，剩余约 {format_duration((total - done) * elapsed / done)}"
+        self.set_status(f"下载中 ({done}/{total}): {title}... {speed}")
+
+    def cancel(self):
+        """停止当前任务"""
+        self.is_downloading = False
+
+    def set_bandwidth(self, mb_per_second):
+        """修改全局带宽上限（MB/秒，0表示不限速），可在下载过程中从其他线程调用"""
+        self.settings['bandwidth_mb'] = max(0.0, float(mb_per_second))
+        self.bandwidth.set_rate(self.settings['bandwidth_mb'] * 1024 * 1024)
+
+    def throttle(self, size):
+        """按全局带宽上限为刚收到的size字节等待"""
+        if not self.bandwidth.consume(size):
+            return
+        started = time.perf_counter()
+        while self.is_downloading:
+            wait = self.bandwidth.pending()
+            if not wait:
+                break
+            time.sleep(min(wait, 0.2))
+        self.metrics.record('bandwidth_wait', time.perf_counter() - started)
+
+    def profiled(self, target):
+        """开启性能分析时，让线程入口target在单独的cProfile中运行，结束后合并保存"""
+        if self.profiles is None:
+            return target
+
+        def run(*args, **kwargs):
+            import cProfile
+
+            profile = cProfile.Profile()
+            try:
+                profile.enable()
+            except ValueError:
+                # Python 3.12起cProfile对所有线程生效，外层的分析已经覆盖这个线程
+                return target(*args, **kwargs)
+            try:
+                return target(*args, **kwargs)
+            finally:
+                profile.disable()
+                with self.progress_lock:
+                    self.profiles.append(profile)
+        return run
+
+    def start_run(self):
+        """开始新任务：重置统计，按设置开启性能分析"""
+        self.is_downloading = True
+        self.failed_pages = {}
+        self.metrics = RunMetrics()
+        self.profiles = [] if self.settings['profile_path'] else None
+
+    def run(self, username, download_dir, quality_label="Original", content_types=CONTENT_TYPES, incremental=False,
+            resume=False, refresh=False):
+        """下载一个用户的内容并返回统计信息，会阻塞直到完成或被停止"""
+        results = self.run_batch([username], download_dir, quality_label, content_types, incremental, resume, refresh)
+        return results.get(username, {})
+
+    def run_batch(self, usernames, download_dir, quality_label="Original", content_types=CONTENT_TYPES,
+                  incremental=False, resume=False, refresh=False):
+        """批量下载多个用户：共用一个下载线程池、连接池和API限速，返回 {用户名: 统计信息}
+
+        resume为True时，搜索已完整记录在任务日志中的用户直接继续未完成的下载，不再重新搜索。
+        refresh为True时不搜索，而是按id批量核对已下载的条目，只重新下载有变化的文件。
+        """
+        os.makedirs(download_dir, exist_ok=True)
+        self.start_run()
+        budget = max(1, int(self.settings['search_concurrency']))
+
+        try:
+            # 本次任务共享的keep-alive会话，连接池大小跟随并发数
+            self.http = HttpClient(self.concurrency, self.settings, self.metrics)
+            self.index = DownloadIndex(download_dir)
+            self.writer = self.start_writer()
+            cache_ttl = float(self.settings['cache_ttl'])
+            if cache_ttl > 0:
+                self.cache = ResponseCache(CACHE_FILE, cache_ttl, float(self.settings['cache_max_mb']) * 1024 * 1024)
+            tasks = [task.strip() for task in str(self.settings['postprocess']).split(',') if task.strip()]
+            if tasks:
+                self.postprocessor = self.start_postprocessor(tasks)
+            self.breakers = HostCircuitBreakers(
+                int(self.settings['breaker_threshold']),
+                float(self.settings['breaker_cooldown'])
+            )
+            # 所有用户的分页请求共用一个线程池，请求总数受同一预算约束
+            with ThreadPoolExecutor(max_workers=budget) as self.search_executor:
+                return self.profiled(self.download_content)(
+                    usernames, download_dir, quality_label, content_types, incremental, resume, refresh
+                )
+        finally:
+            self.search_executor = None
+            self.finish_download()
+            self.is_downloading = False
+
+    def list_user_content(self, username, content_types=CONTENT_TYPES):
+        """只搜索不下载，返回 {内容类型: 完整JSON条目列表}，会阻塞直到完成或被停止"""
+        self.start_run()
+        budget = max(1, int(self.settings['search_concurrency']))
+        try:
+            self.http = HttpClient(self.concurrency, self.settings, self.metrics)
+            search = self.profiled(self.search_user_content)
+            with ThreadPoolExecutor(max_workers=budget) as self.search_executor:
+                return {content_type: search(content_type, username) for content_type in content_types}
+        finally:
+            self.search_executor = None
+            self.finish_download()
+            self.is_downloading = False
+
+    def start_writer(self):
+        """按设置创建后台写盘线程，fsync策略无效时按never处理"""
+        fsync = str(self.settings['fsync'])
+        if fsync not in FSYNC_POLICIES:
+            self.log_message(f"⚠️ 未知的刷盘策略: {fsync}（可选: {', '.join(FSYNC_POLICIES)}），按never处理")
+            fsync = "never"
+        return FileWriter(
+            int(self.settings['write_threads']),
+            int(float(self.settings['write_buffer_mb']) * 1024 * 1024),
+            int(self.settings['write_chunk_kb']) * 1024,
+            fsync,
+            bool(self.settings['preallocate']),
+            self.metrics
+        )
+
+    def start_postprocessor(self, tasks):
+        """创建后处理进程池，任务名称无效或缺少Pillow时返回None"""
+        unknown = [task for task in tasks if task not in POSTPROCESS_TASKS]
+        if unknown:
+            self.log_message(f"⚠️ 未知的后处理任务: {', '.join(unknown)}（可选: {', '.join(POSTPROCESS_TASKS)}）")
+            return None
+        from importlib.util import find_spec
+
+        if find_spec('PIL') is None:
+            self.log_message("⚠️ 未安装Pillow，跳过后处理")
+            return None
+        return MediaPostProcessor(
+            self.index, tasks, int(self.settings['thumbnail_size']),
+            int(self.settings['postprocess_workers']), self.log_message
+        )
+
+    def sleep_while_downloading(self, seconds):
+        """分段等待，期间按下停止按钮会立即返回"""
+        deadline = time.monotonic() + seconds
+        while self.is_downloading and time.monotonic() < deadline:
+            time.sleep(min(0.2, deadline - time.monotonic()))
+
+    def fetch_search_page(self, base_url, api_key, username, offset, limit, revalidate=False):
+        """请求一页搜索结果，返回解析后的JSON；下载被停止时返回空字典
+
+        revalidate为True时（增量同步）不直接使用未过期的缓存，而是发送条件请求确认内容是否变化。
+        """
+        params = {
+            'api_key': api_key,
+            'q': f'@{username}',
+            'limit': limit,
+            'offset': offset,
+            'rating': 'g'
+        }
+        # 缓存键不包含API密钥：不同密钥得到的搜索结果相同
+        cache_key = json.dumps([base_url, params['q'], offset, params['rating'], limit])
+        return self.api_get(base_url, params, f"offset={offset}", cache_key, revalidate)
+
+    def fetch_items_by_id(self, content_type, ids):
+        """用按id批量查询的接口获取条目，返回仍然存在的条目列表；下载被停止时返回None"""
+        # GIF和贴纸共用同一个按id查询的接口
+        url = f"{self.settings['api_base']}v1/gifs"
+        data = self.api_get(url, {'api_key': self.api_key, 'ids': ",".join(ids)}, f"{content_type} ids×{len(ids)}")
+        if not self.is_downloading:
+            return None
+        return data.get('data') or []
+
+    def on_api_success(self, limiter, started):
+        """API请求成功：恢复限速器速率并记录请求耗时"""
+        limiter.on_success()
+        self.metrics.record('search_page', time.perf_counter() - started)
+        self.metrics.add('search_pages')
+
+    def api_get(self, url, params, describe, cache_key=None, revalidate=False):
+        """发送一个API请求，返回解析后的JSON
+
+        所有请求经过该API密钥的限速器；429按Retry-After退避，连接错误和5xx按指数退避加抖动重试，
+        重试用尽后抛出异常。给出cache_key时使用响应缓存，revalidate为True时缓存只用于条件请求。
+        下载被停止时返回空字典。
+        """
+        cached = self.cache.lookup(cache_key) if self.cache and cache_key else None
+        if cached and cached[1] and not revalidate:
+            self.cache.hits += 1
+            return cached[0]
+        headers = cached[2] if cached else {}
+        started = time.perf_counter()
+
+        limiter = get_rate_limiter(params['api_key'], float(self.settings['api_rate']))
+        max_retries = int(self.settings['api_max_retries'])
+        base = float(self.settings['api_backoff_base'])
+        maximum = float(self.settings['api_backoff_max'])
+
+        for attempt in range(max_retries + 1):
+            waited = time.perf_counter()
+            if not limiter.acquire(lambda: self.is_downloading):
+                return {}
+            self.metrics.record('rate_limit_wait', time.perf_counter() - waited)
+            try:
+                response = self.http.get(url, params=params, headers=headers)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                if attempt == max_retries:
+                    raise
+                self.sleep_while_downloading(backoff_delay(attempt, base, maximum))
+                continue
+
+            if response.status_code == 429:
+                delay = parse_retry_after(response.headers.get('Retry-After'))
+                if delay is None:
+                    delay = backoff_delay(attempt, base, maximum)
+                # 最后一次仍被限流时同样降低速率，随后由raise_for_status抛出
+                limiter.on_throttled(delay)
+                if attempt < max_retries:
+                    self.log_message(f"⏳ API限流，{delay:.1f}秒后重试 ({describe})")
+                    continue
+            elif response.status_code >= 500 and attempt < max_retries:
+                self.sleep_while_downloading(backoff_delay(attempt, base, maximum))
+                continue
+
+            if response.status_code == 304 and cached:
+                # 内容未变化，沿用缓存并延长有效期
+                self.on_api_success(limiter, started)
+                self.cache.refresh(cache_key)
+                self.cache.revalidated += 1
+                return cached[0]
+
+            response.raise_for_status()
+            # 只有成功的响应才恢复速率并计入分页统计
+            self.on_api_success(limiter, started)
+            data = response.json()
+            if self.cache and cache_key:
+                self.cache.store(
+                    cache_key, response.content,
+                    response.headers.get('ETag'), response.headers.get('Last-Modified')
+                )
+            return data
+
+    def stream_user_content(self, content_type, username, on_items, known_ids=None, parse=None):
+        """搜索用户内容：先取第一页，再按total_count并发请求其余分页
+
+        每一页到达后立即把去重后的新条目交给 on_items(offset, items)，返回条目总数。
+        提供 known_ids 时改为增量模式：顺序翻页，跳过已知条目，遇到全部已知的一页即停止。
+        提供 parse 时，每个条目在请求线程中就被转换为 parse(item)（需带有id属性），原始JSON不会留在内存中。
+        """
+        base_url = f"{self.settings['api_base']}v1/{content_type}/search"
+        api_key = self.api_key
+        limit = SEARCH_PAGE_LIMIT
+        seen_ids = set()
+        page_sizes = {}
+        failed_offsets = []
+
+        def fetch_page(offset):
+            data = self.fetch_search_page(base_url, api_key, username, offset, limit, revalidate=bool(known_ids))
+            if parse is None:
+                return data
+            return {
+                'data': [parse(item) for item in data.get('data') or []],
+                'pagination': data.get('pagination', {})
+            }
+
+        item_id = (lambda item: item['id']) if parse is None else (lambda item: item.id)
+
+        def report_failure(offset, error):
+            failed_offsets.append(offset)
+            self.log_message(f"❌ API请求失败 (offset={offset}): {str(error)}")
+
+        def emit(offset, data):
+            page = data.get('data') or []
+            page_sizes[offset] = len(page)
+            if known_ids:
+                page = [item for item in page if item_id(item) not in known_ids]
+            new_items = []
+            for item in page:
+                if item_id(item) not in seen_ids:
+                    seen_ids.add(item_id(item))
+                    new_items.append(item)
+            if new_items:
+                on_items(offset, new_items)
+
+        if known_ids:
+            offset = 0
+            while self.is_downloading and offset <= GIPHY_MAX_SEARCH_OFFSET:
+                try:
+                    data = fetch_page(offset)
+                except requests.exceptions.RequestException as e:
+                    report_failure(offset, e)
+                    break
+                new_before = len(seen_ids)
+                emit(offset, data)
+                if len(seen_ids) == new_before or page_sizes[offset] < limit:
+                    break
+                offset += limit
+            return self.finish_search(content_type, username, seen_ids, failed_offsets)
+
+        try:
+            first_page = fetch_page(0)
+        except requests.exceptions.RequestException as e:
+            report_failure(0, e)
+            return self.finish_search(content_type, username, seen_ids, failed_offsets)
+
+        emit(0, first_page)
+        total_count = first_page.get('pagination', {}).get('total_count', page_sizes[0])
+
+        # 其余分页在请求预算内并发获取
+        last_offset = min(total_count - 1, GIPHY_MAX_SEARCH_OFFSET)
+        offsets = list(range(limit, last_offset + 1, limit)) if page_sizes[0] == limit else []
+        if offsets and self.is_downloading:
+            executor = self.search_executor or ThreadPoolExecutor(
+                max_workers=max(1, int(self.settings['search_concurrency']))
+            )
+            try:
+                futures = {
+                    executor.submit(self.profiled(fetch_page), offset): offset
+                    for offset in offsets
+                }
+                for future in as_completed(futures):
+                    if not self.is_downloading:
+                        for pending in futures:
+                            pending.cancel()
+                        break
+                    # 处理完的分页立即释放，不随futures保留到搜索结束
+                    offset = futures.pop(future)
+                    try:
+                        emit(offset, future.result())
+                    except requests.exceptions.RequestException as e:
+                        report_failure(offset, e)
+            finally:
+                if executor is not self.search_executor:
+                    executor.shutdown()
+
+        # total_count可能偏小，最后一页仍是满页时继续顺序翻页
+        offset = max(page_sizes)
+        while self.is_downloading and page_sizes.get(offset) == limit and offset + limit <= GIPHY_MAX_SEARCH_OFFSET:
+            offset += limit
+            try:
+                emit(offset, fetch_page(offset))
+            except requests.exceptions.RequestException as e:
+                report_failure(offset, e)
+                break
+
+        return self.finish_search(content_type, username, seen_ids, failed_offsets)
+
+    def finish_search(self, content_type, username, seen_ids, failed_offsets):
+        """结束一次搜索，重试后仍有失败的分页时明确提示结果不完整"""
+        if failed_offsets:
+            self.failed_pages[username] = self.failed_pages.get(username, 0) + len(failed_offsets)
+            self.log_message(
+                f"⚠️ {username} 的 {content_type} 搜索有 {len(failed_offsets)} 页在重试后仍然失败，"
+                f"列表不完整 (offset: {', '.join(map(str, sorted(failed_offsets)))})"
+            )
+        return len(seen_ids)
+
+    def search_user_content(self, content_type, username):
+        """搜索用户的全部内容，按offset顺序返回去重后的列表"""
+        pages = {}
+        self.stream_user_content(content_type, username, pages.__setitem__)
+        return [item for offset in sorted(pages) for item in pages[offset]]
+
+    def get_quality_url(self, item, quality_key):
+        """根据画质选择获取对应的URL"""
+        try:
+            images = item.get('images', {})
+            if quality_key == 'smallest':
+                url, _ = pick_smallest_rendition(
+                    images,
+                    int(self.settings['min_width']),
+                    int(self.settings['min_height']),
+                    float(self.settings['max_file_mb']) * 1024 * 1024
+                )
+                return url or images.get('original', {}).get('url', '')
+            quality_data = images.get(quality_key, {})
+
+            if 'url' in quality_data:
+                return quality_data['url']
+            elif 'mp4' in quality_data:
+                return quality_data['mp4']
+            elif 'webp' in quality_data:
+                return quality_data['webp']
+            else:
+                return images.get('original', {}).get('url', '')
+        except:
+            return ''
+
+    def download_file(self, url, filepath):
+        """下载单个文件，成功时返回 (字节数, SHA-256)，被停止时返回None，失败时抛出异常
+
+        数据先写入 .part 文件，大小与服务器声明一致后才原子地改名为最终文件；
+        已有 .part 文件时用Range请求续传。
+        """
+        part_path = filepath + PART_SUFFIX
+        resume_from = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        headers = dict(MEDIA_HEADERS)
+        if resume_from:
+            headers['Range'] = f"bytes={resume_from}-"
+
+        response = self.http.get(url, stream=True, headers=headers)
+        content_range = response.headers.get('Content-Range', '')
+        resumed = resume_from and response.status_code == 206 and content_range.startswith(f"bytes {resume_from}-")
+        if response.status_code == 416 or (response.status_code == 206 and not resumed):
+            # 已有的部分文件与服务器上的不一致，或返回的范围不是请求的位置：从头下载
+            response.close()
+            resume_from = 0
+            response = self.http.get(url, stream=True, headers=MEDIA_HEADERS)
+
+        with response:
+            response.raise_for_status()
+            # 只接受完整内容（200）或与续传位置一致的部分内容（206），其他响应体不能当作媒体保存
+            if response.status_code != 200 and not resumed:
+                raise requests.exceptions.HTTPError(
+                    f"{response.status_code} Unexpected status for url: {url}", response=response
+                )
+            self.metrics.record('ttfb', response.elapsed.total_seconds())
+
+            digest = hashlib.sha256()
+            expected_size = None
+            if resumed:
+                # 服务器支持续传：先把已有部分计入哈希
+                with open(part_path, 'rb') as f:
+                    for block in iter(lambda: f.read(1024 * 1024), b''):
+                        digest.update(block)
+                total = content_range.rpartition('/')[2]
+                if total.isdigit():
+                    expected_size = int(total)
+            else:
+                resume_from = 0
+                if response.headers.get('Content-Length', '').isdigit():
+                    expected_size = int(response.headers['Content-Length'])
+
+            size = resume_from
+            transfer_started = time.perf_counter()
+            # 写盘交给后台线程，网络循环只在缓冲区满时等待
+            handle = self.writer.open(part_path, resume_from, expected_size)
+            try:
+                for chunk in response.iter_content(chunk_size=handle.chunk_size):
+                    if not self.is_downloading:
+                        handle.abort().exception()
+                        return None
+                    if chunk:
+                        handle.write(chunk)
+                        size += len(chunk)
+                        digest.update(chunk)
+                        self.throttle(len(chunk))
+            except BaseException:
+                # 等写盘线程关闭文件后再重试，保证 .part 的大小与已写入的数据一致
+                handle.abort().exception()
+                raise
+            self.metrics.record('transfer', time.perf_counter() - transfer_started)
+            self.metrics.add('bytes', size - resume_from)
+
+        if expected_size is not None and size != expected_size:
+            handle.abort().exception()
+            raise IncompleteDownloadError(f"文件不完整 ({size}/{expected_size} 字节)")
+
+        handle.commit(filepath).result()
+        return size, digest.hexdigest()
+
+    def download_with_retries(self, url, filepath, final_pass):
+        """按重试策略下载媒体文件，返回 (状态, 结果)
+
+        状态为 'downloaded'、'deferred'（放入末尾重试队列）或 'failed'。主机熔断期间第一轮直接延后，
+        不占用工作线程；最后一轮则等待冷却结束后再试。
+        """
+        host = urlparse(url).netloc
+        breaker = self.breakers.get(host)
+        filename = os.path.basename(filepath)
+        max_retries = int(self.settings['media_max_retries'])
+        base = float(self.settings['media_backoff_base'])
+        maximum = float(self.settings['media_backoff_max'])
+
+        attempt = 0
+        while self.is_downloading:
+            if not breaker.allow():
+                if not final_pass:
+                    return 'deferred', None
+                self.sleep_while_downloading(breaker.retry_in())
+                continue
+
+            try:
+                result = self.download_file(url, filepath)
+            except Exception as e:
+                if not is_retryable_error(e):
+                    # 主机给出了明确的响应（如404），不计入熔断
+                    breaker.record_success()
+                    self.log_message(f"❌ 下载失败 {filename}: {str(e)}")
+                    return 'failed', None
+                if breaker.record_failure():
+                    self.log_message(f"🚫 {host} 连续失败，暂停使用 {breaker.cooldown:.0f} 秒")
+                if attempt >= max_retries:
+                    if final_pass:
+                        self.log_message(f"❌ 下载失败 {filename}: {str(e)}")
+                        return 'failed', None
+                    return 'deferred', None
+                self.sleep_while_downloading(backoff_delay(attempt, base, maximum))
+                attempt += 1
+                continue
+
+            if result is None:
+                return 'failed', None
+            breaker.record_success()
+            return 'downloaded', result
+
+        return 'failed', None
+
+    def compact_item(self, item, content_type, quality_key):
+        """从搜索结果的完整JSON中提取下载所需的字段"""
+        images = item.get('images', {})
+        url = self.get_quality_url(item, quality_key)
+        try:
+            original_size = int(images.get('original', {}).get('size') or 0)
+        except (TypeError, ValueError):
+            original_size = 0
+        media_format, size = rendition_info(images, url)
+        return ItemRecord(
+            item['id'], content_type, item.get('title', 'Untitled'), url, size, original_size, media_format
+        )
+
+    def item_path(self, record, job):
+        """条目的保存路径（第一次用到时创建所在目录），没有可用URL时返回None"""
+        if not record.url:
+            return None
+        type_dir = os.path.join(job['download_dir'], job['username'], f"{record.content_type}s")
+        if type_dir not in job['type_dirs']:
+            # 每个类型目录只创建一次
+            os.makedirs(type_dir, exist_ok=True)
+            job['type_dirs'].add(type_dir)
+        # URL通常带有查询参数（giphy.mp4?cid=...），扩展名取自选中的渲染格式
+        media_format = record.format or url_format(record.url)
+        return os.path.join(type_dir, f"{record.id}.{media_format}")
+
+    def download_item(self, record, job, final_pass=False):
+        """下载单个条目，返回 'downloaded'、'skipped'、'deferred' 或 'failed'"""
+        filepath = self.item_path(record, job)
+        if not filepath:
+            return 'failed'
+
+        # 索引中已确认完整的文件无需任何网络请求
+        if self.index.is_complete(record.id, job['quality_key'], filepath, self.settings['verify_hash']):
+            return 'skipped'
+
+        started = time.perf_counter()
+        status, result = self.download_with_retries(record.url, filepath, final_pass)
+        if status == 'downloaded':
+            self.complete_item(record, job, filepath, result, time.perf_counter() - started)
+        return status
+
+    def complete_item(self, record, job, filepath, result, elapsed):
+        """文件下载完成后：去重、写入索引、提交后处理并输出日志"""
+        quality_key = job['quality_key']
+        self.metrics.add('files')
+        self.deduplicate(filepath, *result, job)
+        self.index.record(record.id, quality_key, filepath, *result)
+        if self.postprocessor:
+            self.postprocessor.submit(filepath)
+        self.downloaded(filepath)
+        if quality_key == 'smallest' and record.original_size:
+            # 与原始GIF相比节省的流量
+            with job['lock']:
+                job['stats']['bytes_saved'] += max(0, record.original_size - result[0])
+        filename = os.path.basename(filepath)
+        speed = f", {format_bytes(result[0] / elapsed)}/s" if elapsed > 0 else ""
+        self.log_message(f"✅ 已下载: {filename} ({job['quality_label']}画质, {format_bytes(result[0])}{speed})")
+
+    def deduplicate(self, filepath, size, sha256, job):
+        """内容与已下载文件相同时，把新文件换成指向已有文件的链接"""
+        mode = self.settings['dedup']
+        if mode == "off":
+            return
+        source = self.index.find_duplicate(sha256, size, filepath)
+        if not source:
+            return
+        try:
+            linked = link_duplicate(source, filepath, mode)
+        except OSError as e:
+            self.log_message(f"⚠️ 重复文件链接失败，保留副本: {str(e)}")
+            return
+        if linked:
+            with job['lock']:
+                job['stats']['deduplicated'] += 1
+                job['stats']['dedup_bytes'] += size
+
+    def download_worker(self, scheduler, final_pass):
+        """下载工作线程：按调度器的轮询顺序取条目下载，直到所有来源结束或被停止"""
+        should_continue = lambda: self.is_downloading
+        while True:
+            entry = scheduler.get(should_continue)
+            if entry is None or not self.is_downloading:
+                return
+
+            job, record = entry
+            self.settle_entry(entry, self.download_item(record, job, final_pass))
+
+    def settle_entry(self, entry, status):
+        """记录一个条目的处理结果：延后的放入重试队列，其余更新统计和进度"""
+        job, record = entry
+        if status == 'deferred':
+            with job['lock']:
+                job['retry_items'].append(entry)
+            return
+        if status != 'failed':
+            self.index.mark_seen(job['username'], f"{record.content_type}s", record.id)
+
+        with job['lock']:
+            job['stats']['done'] += 1
+            job['stats'][status] += 1
+        with self.progress_lock:
+            self.progress_totals['done'] += 1
+            done, found = self.progress_totals['done'], self.progress_totals['found']
+        self.update_progress(done, found, record.title[:18])
+
+    def start_workers(self, scheduler, final_pass=False):
+        """启动与并发数相同的下载工作线程"""
+        workers = [
+            threading.Thread(target=self.profiled(self.download_worker), args=(scheduler, final_pass), daemon=True)
+            for _ in range(self.concurrency)
+        ]
+        for thread in workers:
+            thread.start()
+        return workers
+
+    def produce_job(self, job, scheduler, content_types, incremental, resume=False):
+        """搜索一个用户的内容，每页结果立即写入任务日志并放入该用户在调度器中的子队列"""
+        username = job['username']
+
+        def enqueue(content_type, journal=True):
+            def on_items(offset, items):
+                if journal:
+                    self.index.journal_add(username, f"{content_type}s", items)
+                with job['lock']:
+                    job['stats']['found'] += len(items)
+                with self.progress_lock:
+                    self.progress_totals['found'] += len(items)
+                for record in items:
+                    if not scheduler.put(job, (job, record), lambda: self.is_downloading):
+                        return
+            return on_items
+
+        def parse(content_type):
+            return lambda item: self.compact_item(item, content_type, job['quality_key'])
+
+        def search(content_type):
+            """从任务日志恢复或重新搜索一种内容，返回找到的条目数"""
+            if resume:
+                pending = self.index.journal_pending(username, content_type)
+                if pending is not None:
+                    label = 'GIF' if content_type == 'gifs' else '贴纸'
+                    self.log_message(f"📒 {username}: 从任务日志恢复 {len(pending)} 个未完成的{label}文件")
+                    if pending:
+                        enqueue(content_type[:-1], journal=False)(0, pending)
+                    return 0
+            # 增量模式下只关心此前未处理过的条目
+            known_ids = self.index.known_ids(username, content_type) if incremental else None
+            failed_before = self.failed_pages.get(username, 0)
+            self.index.journal_begin(username, content_type)
+            count = self.stream_user_content(
+                content_type, username, enqueue(content_type[:-1]), known_ids, parse(content_type[:-1])
+            )
+            if self.is_downloading and self.failed_pages.get(username, 0) == failed_before:
+                self.index.journal_complete(username, content_type)
+            return count
+
+        try:
+            self.log_message(f"🔍 开始搜索用户 '{username}' 的内容...")
+
+            # 搜索GIFs
+            if 'gifs' in content_types and self.is_downloading:
+                self.set_status("搜索GIF中...")
+                gif_count = search('gifs')
+                if gif_count:
+                    self.log_message(f"📁 {username}: 找到 {gif_count} 个{'新' if incremental else ''}GIF文件")
+
+            # 搜索Stickers
+            if 'stickers' in content_types and self.is_downloading:
+                self.set_status("搜索贴纸中...")
+                sticker_count = search('stickers')
+                if sticker_count:
+                    self.log_message(f"📁 {username}: 找到 {sticker_count} 个{'新' if incremental else ''}贴纸文件")
+
+            if job['stats']['found']:
+                self.log_message(f"🎯 {username}: 搜索完成，共找到 {job['stats']['found']} 个文件")
+        finally:
+            # 通知调度器该用户不会再有新条目
+            scheduler.finish_source(job)
+
+    def local_items(self, job, content_type):
+        """该用户该类型已下载的条目 {条目id: 路径}：以索引为准，再补上目录中索引没有记录的文件"""
+        type_dir = os.path.join(job['download_dir'], job['username'], content_type)
+        items = self.index.downloaded_paths(type_dir, job['quality_key'])
+        try:
+            names = os.listdir(type_dir)
+        except OSError:
+            names = []
+        for name in names:
+            item_id, extension = os.path.splitext(name)
+            if extension in ('.gif', '.mp4', '.webp') and not name.startswith('.'):
+                items.setdefault(item_id, os.path.join(type_dir, name))
+        return items
+
+    def is_changed(self, record, filepath, job):
+        """服务器上的渲染版本与本地文件不一致（格式或大小变化、文件丢失）时返回True"""
+        target = self.item_path(record, job)
+        if not target:
+            return False
+        if target != filepath:
+            return True
+        try:
+            size = os.path.getsize(filepath)
+        except OSError:
+            return True
+        return bool(record.size) and size != record.size
+
+    def refresh_job(self, job, scheduler, content_types):
+        """按id批量核对一个用户已下载的条目：报告已删除的条目，有变化的文件放入调度器重新下载"""
+        username = job['username']
+        quality_key = job['quality_key']
+
+        def check(content_type, local, batch, items):
+            records = {record.id: record for record in (
+                self.compact_item(item, content_type[:-1], quality_key) for item in items
+            )}
+            deleted = [item_id for item_id in batch if item_id not in records]
+            changed = [
+                record for item_id, record in records.items()
+                if item_id in local and self.is_changed(record, local[item_id], job)
+            ]
+            with job['lock']:
+                job['stats']['checked'] += len(batch)
+                job['stats']['deleted'] += len(deleted)
+                job['stats']['changed'] += len(changed)
+                job['stats']['found'] += len(changed)
+            if deleted:
+                shown = ", ".join(deleted[:10]) + (" ..." if len(deleted) > 10 else "")
+                self.log_message(f"🗑️ {username}: {len(deleted)} 个条目已在GIPHY上删除，本地文件保留 ({shown})")
+            with self.progress_lock:
+                self.progress_totals['found'] += len(changed)
+            for record in changed:
+                # 删除旧记录，下载时不会因为本地已有文件而跳过
+                self.index.forget(record.id, quality_key)
+                if not scheduler.put(job, (job, record), lambda: self.is_downloading):
+                    return
+
+        try:
+            self.log_message(f"🔄 开始核对用户 '{username}' 已下载的内容...")
+            for content_type in content_types:
+                if not self.is_downloading:
+                    break
+                local = self.local_items(job, content_type)
+                if not local:
+                    continue
+                self.set_status(f"核对中: {username} {content_type}...")
+                ids = sorted(local)
+                batches = [ids[start:start + REFRESH_BATCH_SIZE] for start in range(0, len(ids), REFRESH_BATCH_SIZE)]
+                # 各批次在搜索线程池中并发请求，总请求数仍受API限速约束
+                futures = {
+                    self.search_executor.submit(self.profiled(self.fetch_items_by_id), content_type, batch): batch
+                    for batch in batches
+                }
+                for future in as_completed(futures):
+                    batch = futures.pop(future)
+                    try:
+                        items = future.result()
+                    except requests.exceptions.RequestException as e:
+                        self.failed_pages[username] = self.failed_pages.get(username, 0) + 1
+                        self.log_message(f"❌ API请求失败 ({content_type} ids×{len(batch)}): {str(e)}")
+                        continue
+                    if items is None or not self.is_downloading:
+                        for pending in futures:
+                            pending.cancel()
+                        break
+                    check(content_type, local, batch, items)
+
+            stats = job['stats']
+            if stats['checked']:
+                self.log_message(
+                    f"🔎 {username}: 核对 {stats['checked']} 个条目，{stats['changed']} 个有变化需要重新下载，"
+                    f"{stats['deleted']} 个已被删除"
+                )
+        finally:
+            scheduler.finish_source(job)
+
+    def schedule_key(self):
+        """按设置的下载顺序返回调度器的排序键，策略无效时按fifo处理"""
+        policy = str(self.settings['schedule'])
+        if policy not in SCHEDULE_POLICIES:
+            self.log_message(f"⚠️ 未知的下载顺序: {policy}（可选: {', '.join(SCHEDULE_POLICIES)}），按fifo处理")
+            self.settings['schedule'] = policy = "fifo"
+        return schedule_key(policy)
+
+    def new_job(self, username, download_dir, quality_label):
+        """一个用户的下载任务状态"""
+        return {
+            'download_dir': download_dir,
+            'username': username,
+            'quality_key': QUALITY_MAPPING[quality_label],
+            'quality_label': quality_label,
+            'stats': {
+                'found': 0, 'done': 0, 'downloaded': 0, 'skipped': 0, 'failed': 0,
+                'bytes_saved': 0, 'deduplicated': 0, 'dedup_bytes': 0,
+                'checked': 0, 'changed': 0, 'deleted': 0
+            },
+            'retry_items': [],
+            'type_dirs': set(),
+            'lock': threading.Lock(),
+        }
+
+    def download_content(self, usernames, download_dir, quality_label, content_types, incremental, resume=False,
+                         refresh=False):
+        """主要下载逻辑：每个用户一个搜索线程边翻页边入队，共用的工作线程按轮询顺序取出下载"""
+        jobs = [self.new_job(username, download_dir, quality_label) for username in dict.fromkeys(usernames)]
+        self.progress_totals = {'found': 0, 'done': 0}
+        self.set_status(f"搜索中...")
+
+        # 每个用户一个有界子队列：下载跟不上时暂停该用户的翻页，大账号也无法挤占其他用户
+        scheduler = FairScheduler(max(1, int(self.settings['queue_size'])), self.schedule_key())
+        for job in jobs:
+            scheduler.add_source(job)
+        workers = self.start_workers(scheduler)
+
+        producers = [
+            threading.Thread(
+                target=self.profiled(self.refresh_job if refresh else self.produce_job),
+                args=(job, scheduler, content_types) if refresh else (job, scheduler, content_types, incremental, resume),
+                daemon=True
+            )
+            for job in jobs
+        ]
+        for thread in producers:
+            thread.start()
+        for thread in producers + workers:
+            thread.join()
+
+        # 暂时失败或主机熔断而延后的条目在最后再处理一轮
+        retry_count = sum(len(job['retry_items']) for job in jobs)
+        if retry_count and self.is_downloading:
+            self.log_message(f"🔁 重试 {retry_count} 个暂时失败的文件...")
+            retry_scheduler = FairScheduler(None, self.schedule_key())
+            for job in jobs:
+                retry_scheduler.add_source(job)
+                for entry in job['retry_items']:
+                    retry_scheduler.put(job, entry, lambda: True)
+                retry_scheduler.finish_source(job)
+            for thread in self.start_workers(retry_scheduler, final_pass=True):
+                thread.join()
+
+        for job in jobs:
+            job['stats']['search_failed'] = self.failed_pages.get(job['username'], 0)
+
+        if len(jobs) == 1:
+            self.report_job(jobs[0], incremental or resume or refresh)
+        else:
+            self.report_batch(jobs)
+        return {job['username']: job['stats'] for job in jobs}
+
+    def report_job(self, job, incremental):
+        """单个用户的下载总结"""
+        stats = job['stats']
+        if not stats['found']:
+            if incremental and self.is_downloading:
+                self.set_status("没有新内容")
+                self.log_message("✅ 没有发现新内容，本地已是最新")
+            else:
+                self.set_status("未找到内容")
+                self.log_message("❌ 未找到任何内容")
+            return
+
+        # 完成下载
+        if self.is_downloading:
+            total_downloaded = stats['downloaded']
+            self.set_progress(1.0)
+            self.set_status(f"✨ 下载完成! 共 {total_downloaded} 个文件")
+            self.log_message(f"🎉 下载完成! 总共下载了 {total_downloaded} 个文件")
+            if stats['skipped']:
+                self.log_message(f"⏭️ 跳过 {stats['skipped']} 个已完整下载的文件")
+            if stats['failed']:
+                self.log_message(f"⚠️ {stats['failed']} 个文件下载失败")
+            if stats['bytes_saved']:
+                self.log_message(f"💡 与原始GIF相比节省了 {format_bytes(stats['bytes_saved'])} 流量")
+            if stats['deduplicated']:
+                self.log_message(
+                    f"🔗 {stats['deduplicated']} 个重复文件已改为链接，节省 {format_bytes(stats['dedup_bytes'])} 磁盘空间"
+                )
+            self.log_message(f"📂 文件保存位置: {os.path.join(job['download_dir'], job['username'])}")
+
+    def report_batch(self, jobs):
+        """批量下载结束后逐个用户输出总结"""
+        total_downloaded = sum(job['stats']['downloaded'] for job in jobs)
+        if self.is_downloading:
+            self.set_progress(1.0)
+            self.set_status(f"✨ 批量下载完成! 共 {total_downloaded} 个文件")
+            self.log_message(f"🎉 批量下载完成! {len(jobs)} 个用户，总共下载了 {total_downloaded} 个文件")
+            bytes_saved = sum(job['stats']['bytes_saved'] for job in jobs)
+            if bytes_saved:
+                self.log_message(f"💡 与原始GIF相比共节省了 {format_bytes(bytes_saved)} 流量")
+            deduplicated = sum(job['stats']['deduplicated'] for job in jobs)
+            if deduplicated:
+                dedup_bytes = sum(job['stats']['dedup_bytes'] for job in jobs)
+                self.log_message(f"🔗 {deduplicated} 个重复文件已改为链接，共节省 {format_bytes(dedup_bytes)} 磁盘空间")
+
+        for job in jobs:
+            stats = job['stats']
+            summary = (
+                f"📊 {job['username']}: 找到 {stats['found']}，下载 {stats['downloaded']}，"
+                f"跳过 {stats['skipped']}，失败 {stats['failed']}"
+            )
+            if stats['checked']:
+                summary += f"，核对 {stats['checked']}（变化 {stats['changed']}，已删除 {stats['deleted']}）"
+            if stats['search_failed']:
+                summary += f"，搜索失败 {stats['search_failed']} 页"
+            self.log_message(summary)
+        self.log_message(f"📂 文件保存位置: {jobs[0]['download_dir']}")
+
+    def finish_download(self):
+        """输出连接复用与耗时统计，按设置导出指标和性能分析结果，并关闭会话与索引"""
+        if self.writer:
+            self.writer.close()
+            self.writer = None
+        if self.postprocessor:
+            if self.is_downloading:
+                self.log_message("🖼️ 等待剩余的后处理完成...")
+            counts = self.postprocessor.close(wait=self.is_downloading)
+            if counts['submitted']:
+                self.log_message(f"🖼️ 后处理完成 {counts['processed']} 个文件，失败 {counts['failed']} 个")
+            self.postprocessor = None
+        self.metrics.finish()
+        self.report_metrics()
+        if self.http:
+            for host, stats in sorted(self.http.connection_stats().items()):
+                self.log_message(
+                    f"🔌 {host}: 请求 {stats['requests']} 次, "
+                    f"新建连接 {stats['new_connections']} 次, 复用 {stats['reused']} 次"
+                )
+            self.http.close()
+            self.http = None
+        if self.index:
+            self.index.close()
+            self.index = None
+        if self.cache:
+            if self.cache.hits or self.cache.revalidated:
+                self.log_message(
+                    f"🗄️ 搜索缓存: 直接命中 {self.cache.hits} 页, 条件请求未变化 {self.cache.revalidated} 页"
+                )
+            self.cache.close()
+            self.cache = None
+
+    def report_metrics(self):
+        """输出各阶段耗时，并按设置导出统计和cProfile结果"""
+        summary = self.metrics.summary()
+        phases = [
+            f"{label} {summary['phases'][phase]['total_seconds']:.1f}s"
+            for phase, label in RunMetrics.PHASES.items()
+            if phase in summary['phases']
+        ]
+        if phases:
+            self.log_message(
+                f"⏱️ 用时 {format_duration(summary['elapsed_seconds'])}，平均 "
+                f"{format_bytes(summary['bytes_per_second'])}/s；各阶段累计: {'，'.join(phases)}"
+            )
+
+        metrics_path = self.settings['metrics_path']
+        if metrics_path:
+            try:
+                self.metrics.export(metrics_path)
+                self.log_message(f"📈 统计数据已导出: {metrics_path}")
+            except OSError as e:
+                self.log_message(f"❌ 统计数据导出失败: {str(e)}")
+
+        profile_path = self.settings['profile_path']
+        if profile_path and self.profiles:
+            import pstats
+
+            try:
+                pstats.Stats(*self.profiles).dump_stats(profile_path)
+                self.log_message(f"🧪 性能分析结果已保存: {profile_path}")
+            except OSError as e:
+                self.log_message(f"❌ 性能分析结果保存失败: {str(e)}")
+        self.profiles = None
+
@@ -0,0 +1,306 @@
+import math
+import os
+import queue
+import threading
+import tkinter as tk
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import customtkinter as ctk
+from PIL import Image, ImageTk
+
+from giphy_engine import THUMBNAIL_DIRNAME
+
+# 图形界面的预览区：画布上只为可见的格子创建元素并循环复用，缩略图在后台线程中解码（只读第一帧），
+# 解码结果放入按内存上限淘汰的LRU缓存，因此条目再多，滚动时的开销和内存占用都不会增长。
+
+MEDIA_EXTENSIONS = ('.gif', '.webp', '.mp4')
+DECODABLE_EXTENSIONS = ('.gif', '.webp', '.png')
+POLL_MS = 50               # 主线程取回解码结果的间隔（毫秒）
+MAX_RESULTS_PER_POLL = 48  # 每次最多转换的图像数，避免大量结果同时到达时卡住界面
+
+
+def thumbnail_source(root_dir, path):
+    """优先使用后处理生成的缩略图（.thumbnails 中的PNG），没有时读取原文件"""
+    relative = os.path.relpath(path, root_dir)
+    thumbnail = os.path.join(root_dir, THUMBNAIL_DIRNAME, relative + ".png")
+    return thumbnail if os.path.exists(thumbnail) else path
+
+
+def decode_thumbnail(path, size):
+    """读取第一帧并缩小到size以内，返回PIL图像；MP4等无法解码的文件返回None"""
+    if not path.lower().endswith(DECODABLE_EXTENSIONS):
+        return None
+    try:
+        with Image.open(path) as image:
+            # 打开后位于第一帧，convert只解码当前帧，不会读取整个动画
+            frame = image.convert('RGBA')
+        frame.thumbnail((size, size))
+        return frame
+    except Exception:
+        return None
+
+
+def scan_media(root_dir):
+    """列出下载目录中的媒体文件（跳过 .thumbnails 等隐藏目录），按修改时间从新到旧排列"""
+    found = []
+    for directory, dirnames, filenames in os.walk(root_dir):
+        dirnames[:] = sorted(name for name in dirnames if not name.startswith('.'))
+        for name in filenames:
+            if name.lower().endswith(MEDIA_EXTENSIONS) and not name.startswith('.'):
+                path = os.path.join(directory, name)
+                try:
+                    found.append((os.path.getmtime(path), path))
+                except OSError:
+                    continue
+    found.sort(reverse=True)
+    return [path for _, path in found]
+
+
+class ThumbnailCache:
+    """按字节数上限淘汰最久未使用条目的LRU缓存（只在主线程中使用）"""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max(1, max_bytes)
+        self.entries = OrderedDict()  # 键 -> (值, 字节数)
+        self.size = 0
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        self.entries.move_to_end(key)
+        return entry[0]
+
+    def put(self, key, value, size):
+        if key in self.entries:
+            self.size -= self.entries.pop(key)[1]
+        self.entries[key] = (value, size)
+        self.size += size
+        while self.size > self.max_bytes and len(self.entries) > 1:
+            _, (_, evicted) = self.entries.popitem(last=False)
+            self.size -= evicted
+
+    def clear(self):
+        self.entries.clear()
+        self.size = 0
+
+
+class ThumbnailGallery(ctk.CTkFrame):
+    """虚拟化的缩略图网格：条目只保存路径，画布元素数量只与可见区域大小有关"""
+
+    def __init__(self, master, thumbnail_size=120, cache_mb=64, workers=2, font=None,
+                 bg="#2b2b2b", fg="#dce4ee", **kwargs):
+        super().__init__(master, fg_color="transparent", **kwargs)
+        self.thumbnail_size = thumbnail_size
+        self.cell_width = thumbnail_size + 16
+        self.cell_height = thumbnail_size + 30
+        self.font = font
+        self.fg = fg
+        self.root_dir = None
+        self.paths = []
+        self.known = set()
+        self.columns = 1
+        self.cache = ThumbnailCache(int(cache_mb * 1024 * 1024))
+        self.executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="thumbnail")
+        self.results = queue.SimpleQueue()
+        self.pending = set()  # 已提交解码、结果尚未取回的路径
+        self.wanted = set()   # 当前可见的路径；解码开始时已离开视野的直接跳过
+        self.wanted_lock = threading.Lock()
+        self.cells = []       # 复用的画布元素 [图片id, 文字id, 显示的路径, 引用的PhotoImage]
+        self.layout_scheduled = False
+        self.scan_generation = 0
+
+        self.canvas = tk.Canvas(self, bg=bg, highlightthickness=0, yscrollincrement=self.cell_height // 3)
+        self.scrollbar = ctk.CTkScrollbar(self, command=self.canvas.yview)
+        self.scrollbar.pack(side="right", fill="y")
+        self.canvas.pack(side="left", fill="both", expand=True)
+        self.canvas.configure(yscrollcommand=self.on_scroll)
+        self.empty_text = self.canvas.create_text(
+            10, 10, anchor="nw", text="暂无已下载的文件", fill=fg, font=font
+        )
+
+        self.canvas.bind("<Configure>", lambda event: self.schedule_layout())
+        # Windows上滚轮事件发给拥有焦点的控件
+        self.canvas.bind("<Enter>", lambda event: self.canvas.focus_set())
+        for sequence in ("<MouseWheel>", "<Button-4>", "<Button-5>"):
+            self.canvas.bind(sequence, self.on_mousewheel)
+        self.after(POLL_MS, self.poll_results)
+
+    def load_directory(self, root_dir):
+        """在后台线程扫描下载目录并显示其中的媒体文件"""
+        self.root_dir = root_dir
+        self.scan_generation += 1
+        generation = self.scan_generation
+
+        def scan():
+            paths = scan_media(root_dir) if os.path.isdir(root_dir) else []
+            self.results.put(('scan', generation, paths))
+
+        threading.Thread(target=scan, daemon=True).start()
+
+    def set_paths(self, paths):
+        self.paths = list(paths)
+        self.known = set(self.paths)
+        self.canvas.yview_moveto(0)
+        self.schedule_layout()
+
+    def add_paths(self, paths):
+        """把新下载完成的文件加到最前面"""
+        new_paths = [path for path in reversed(paths) if path not in self.known]
+        if not new_paths:
+            return
+        self.known.update(new_paths)
+        self.paths[:0] = new_paths
+        self.schedule_layout()
+
+    def schedule_layout(self):
+        """同一轮事件中的多次变化只重新布局一次"""
+        if not self.layout_scheduled:
+            self.layout_scheduled = True
+            self.after_idle(self.layout)
+
+    def layout(self):
+        """按画布宽度计算列数和总高度，然后刷新可见区域"""
+        self.layout_scheduled = False
+        width = max(1, self.canvas.winfo_width())
+        self.columns = max(1, width // self.cell_width)
+        rows = math.ceil(len(self.paths) / self.columns)
+        self.canvas.configure(scrollregion=(0, 0, width, max(rows * self.cell_height, 1)))
+        self.canvas.itemconfigure(self.empty_text, state="hidden" if self.paths else "normal")
+        self.refresh_visible()
+
+    def on_scroll(self, first, last):
+        self.scrollbar.set(first, last)
+        self.refresh_visible()
+
+    def on_mousewheel(self, event):
+        """Windows/macOS使用delta，Linux使用Button-4/5"""
+        if event.num == 4:
+            step = -1
+        elif event.num == 5:
+            step = 1
+        else:
+            step = -max(1, abs(event.delta) // 120) if event.delta > 0 else max(1, abs(event.delta) // 120)
+        self.canvas.yview_scroll(step * 3, "units")
+        return "break"
+
+    def refresh_visible(self):
+        """把复用的画布元素摆到可见的格子上，并为还没有缩略图的条目提交解码"""
+        top = self.canvas.canvasy(0)
+        height = max(1, self.canvas.winfo_height())
+        first_row = max(0, int(top // self.cell_height))
+        last_row = int((top + height) // self.cell_height)
+        start = first_row * self.columns
+        visible = self.paths[start:(last_row + 1) * self.columns]
+
+        while len(self.cells) < len(visible):
+            image_id = self.canvas.create_image(0, 0, anchor="n")
+            text_id = self.canvas.create_text(0, 0, anchor="n", fill=self.fg, font=self.font)
+            for item in (image_id, text_id):
+                self.canvas.tag_bind(item, "<Double-Button-1>", self.on_double_click)
+            self.cells.append([image_id, text_id, None, None])
+
+        with self.wanted_lock:
+            self.wanted = set(visible)
+        for offset, cell in enumerate(self.cells):
+            image_id, text_id = cell[0], cell[1]
+            if offset >= len(visible):
+                if cell[2] is not None:
+                    self.canvas.itemconfigure(image_id, state="hidden", image="")
+                    self.canvas.itemconfigure(text_id, state="hidden")
+                    cell[2] = cell[3] = None
+                continue
+            index = start + offset
+            path = visible[offset]
+            x = (index % self.columns) * self.cell_width + self.cell_width // 2
+            y = (index // self.columns) * self.cell_height
+            self.canvas.coords(image_id, x, y + 6)
+            self.canvas.coords(text_id, x, y + self.thumbnail_size + 10)
+            if cell[2] != path:
+                cell[2] = path
+                self.canvas.itemconfigure(text_id, text=self.label(path), state="normal")
+                self.show_image(cell, self.cache.get(path))
+                if path not in self.cache and path not in self.pending:
+                    self.pending.add(path)
+                    self.executor.submit(self.decode, path)
+
+    def label(self, path):
+        name = os.path.basename(path)
+        limit = max(6, self.cell_width // 8)
+        return name if len(name) <= limit else name[:limit - 1] + "…"
+
+    def show_image(self, cell, photo):
+        """格子保存自己显示的PhotoImage引用，被缓存淘汰时也不会从画面上消失"""
+        cell[3] = photo
+        self.canvas.itemconfigure(cell[0], image=photo or "", state="normal")
+
+    def decode(self, path):
+        """后台线程：条目仍然可见时读取第一帧"""
+        with self.wanted_lock:
+            if path not in self.wanted:
+                self.results.put(('skipped', path, None))
+                return
+        source = thumbnail_source(self.root_dir, path) if self.root_dir else path
+        self.results.put(('thumbnail', path, decode_thumbnail(source, self.thumbnail_size)))
+
+    def poll_results(self):
+        """主线程：把解码好的图像转换为PhotoImage放入缓存，并更新正在显示它的格子"""
+        try:
+            for _ in range(MAX_RESULTS_PER_POLL):
+                kind, key, value = self.results.get_nowait()
+                if kind == 'scan':
+                    if key == self.scan_generation:
+                        self.set_paths(value)
+                    continue
+                self.pending.discard(key)
+                if kind == 'skipped':
+                    # 跳过后又滚动回来的条目重新提交
+                    if any(cell[2] == key for cell in self.cells):
+                        self.pending.add(key)
+                        self.executor.submit(self.decode, key)
+                    continue
+                if value is None:
+                    # 无法解码（如MP4）也缓存下来，避免反复尝试
+                    self.cache.put(key, None, 64)
+                    continue
+                photo = ImageTk.PhotoImage(value)
+                self.cache.put(key, photo, value.width * value.height * 4)
+                for cell in self.cells:
+                    if cell[2] == key:
+                        self.show_image(cell, photo)
+        except queue.Empty:
+            pass
+        self.after(POLL_MS, self.poll_results)
+
+    def on_double_click(self, event):
+        """双击用系统默认程序打开文件"""
+        item = self.canvas.find_withtag("current")
+        for cell in self.cells:
+            if item and item[0] in (cell[0], cell[1]) and cell[2]:
+                open_with_system(cell[2])
+                return
+
+    def destroy(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        self.cache.clear()
+        super().destroy()
+
+
+def open_with_system(path):
+    """用操作系统关联的程序打开文件"""
+    import platform
+    import subprocess
+
+    try:
+        if platform.system() == "Windows":
+            os.startfile(path)
+        elif platform.system() == "Darwin":
+            subprocess.Popen(["open", path])
+        else:
+            subprocess.Popen(["xdg-open", path])
+    except OSError:
+        pass
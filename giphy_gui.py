@@ -0,0 +1,772 @@
+import tkinter as tk
+from tkinter import filedialog, messagebox
+import customtkinter as ctk
+import os
+import threading
+import queue
+import time
+import platform
+
+from giphy_engine import (
+    DEFAULT_CONCURRENCY,
+    DEFAULT_SETTINGS,
+    QUALITY_MAPPING,
+    GiphyEngine,
+    clamp_concurrency,
+    normalize_quality,
+    parse_usernames,
+    read_config,
+    settings_from_config,
+    write_config,
+)
+from giphy_gallery import ThumbnailGallery
+
+# 主线程批量刷新界面的间隔（毫秒）
+UI_REFRESH_MS = 100
+
+# 底部标签页名称
+LOG_TAB = "📝 日志"
+GALLERY_TAB = "🖼️ 预览"
+
+# 下载顺序选项
+SCHEDULE_LABELS = {
+    "fifo": "发现顺序",
+    "smallest": "小文件优先",
+    "largest": "大文件优先",
+}
+
+# 设置CustomTkinter外观模式和主题
+ctk.set_appearance_mode("dark")
+ctk.set_default_color_theme("blue")
+
+class LargerFontGiphyDownloader:
+    def __init__(self):
+        # 创建主窗口
+        self.root = ctk.CTk()
+        self.root.title("Giphy下载器")
+
+        # 设置高DPI感知，提高字体清晰度
+        try:
+            from ctypes import windll
+            windll.shcore.SetProcessDpiAwareness(1)  # 设置DPI感知
+        except:
+            pass
+
+        # 设置紧凑型窗口尺寸
+        screen_width = self.root.winfo_screenwidth()
+        screen_height = self.root.winfo_screenheight()
+
+        # 根据屏幕分辨率调整字体和窗口大小 - 增大字体
+        if screen_width >= 1920:
+            window_width, window_height = 880, 620  # 稍微增大窗口
+            self.font_size = 13  # 从11增大到13
+        elif screen_width >= 1366:
+            window_width, window_height = 800, 600  # 稍微增大窗口
+            self.font_size = 12  # 从10增大到12
+        else:
+            window_width, window_height = 740, 570  # 稍微增大窗口
+            self.font_size = 11  # 从9增大到11
+
+        # 居中显示窗口
+        x = (screen_width - window_width) // 2
+        y = (screen_height - window_height) // 2
+        self.root.geometry(f"{window_width}x{window_height}+{x}+{y}")
+        self.root.minsize(720, 520)  # 增大最小尺寸
+        self.root.resizable(True, True)
+
+        # 检测系统并选择最佳字体
+        self.setup_fonts()
+
+        # 初始化变量
+        self.api_key = tk.StringVar()
+        self.author_name = tk.StringVar()
+        self.download_path = tk.StringVar(value=os.path.join(os.getcwd(), "downloads"))
+        self.quality_option = tk.StringVar(value="Original")
+        self.download_gifs = tk.BooleanVar(value=True)
+        self.download_stickers = tk.BooleanVar(value=True)
+        self.concurrency = tk.IntVar(value=DEFAULT_CONCURRENCY)
+        self.incremental = tk.BooleanVar(value=False)
+        self.resume = tk.BooleanVar(value=False)
+        self.bandwidth = tk.StringVar(value="0")
+        self.schedule_option = tk.StringVar(value="发现顺序")
+        self.settings = dict(DEFAULT_SETTINGS)
+        self.engine = None
+
+        # 后台线程提交的界面更新，由主线程定时批量应用
+        self.ui_queue = queue.SimpleQueue()
+        self.log_line_count = 0
+
+        # 画质选项映射
+        self.quality_mapping = QUALITY_MAPPING
+
+        # 加载保存的配置
+        self.load_config()
+
+        self.setup_larger_font_ui()
+
+        # 绑定窗口关闭事件
+        self.root.protocol("WM_DELETE_WINDOW", self.on_closing)
+
+        # 启动界面更新队列的定时处理
+        self.root.after(UI_REFRESH_MS, self.process_ui_queue)
+
+    def setup_fonts(self):
+        """设置最适合的系统字体"""
+        system = platform.system()
+
+        if system == "Windows":
+            # Windows系统推荐字体
+            self.ui_font_family = "Microsoft YaHei UI"  # 微软雅黑UI，专为界面优化
+            self.code_font_family = "Consolas"  # 等宽字体
+            # 备用字体
+            self.fallback_fonts = ["Segoe UI", "Arial", "SimHei"]
+        else:
+            # 其他系统备用字体
+            self.ui_font_family = "Arial"
+            self.code_font_family = "Courier New"
+            self.fallback_fonts = ["Arial", "DejaVu Sans"]
+
+        # 测试字体可用性
+        try:
+            test_font = ctk.CTkFont(family=self.ui_font_family, size=10)
+            # 如果能创建则字体可用
+        except:
+            # 字体不可用，使用备用字体
+            for fallback in self.fallback_fonts:
+                try:
+                    test_font = ctk.CTkFont(family=fallback, size=10)
+                    self.ui_font_family = fallback
+                    break
+                except:
+                    continue
+
+    def create_font(self, size, family=None, weight="normal"):
+        """创建优化的字体对象"""
+        if family is None:
+            family = self.ui_font_family
+
+        return ctk.CTkFont(
+            family=family,
+            size=size,
+            weight=weight,
+            underline=False,
+            overstrike=False
+        )
+
+    def load_config(self):
+        """加载保存的配置"""
+        config = read_config()
+        self.api_key.set(config.get('api_key', ''))
+        self.download_path.set(config.get('download_path', os.path.join(os.getcwd(), "downloads")))
+        self.quality_option.set(normalize_quality(config.get('quality', 'Original')))
+        self.concurrency.set(clamp_concurrency(config.get('concurrency', DEFAULT_CONCURRENCY)))
+        self.incremental.set(bool(config.get('incremental', False)))
+        self.settings = settings_from_config(config)
+        self.bandwidth.set(f"{self.get_bandwidth(self.settings['bandwidth_mb']):g}")
+        self.schedule_option.set(SCHEDULE_LABELS.get(self.settings['schedule'], "发现顺序"))
+
+    def save_config(self):
+        """保存配置到文件"""
+        write_config({
+            'api_key': self.api_key.get(),
+            'download_path': self.download_path.get(),
+            'quality': self.quality_option.get(),
+            'concurrency': self.get_concurrency(),
+            'incremental': self.incremental.get(),
+            **self.settings
+        })
+
+    def get_concurrency(self):
+        """读取当前并发数（输入框可能包含非法内容）"""
+        try:
+            return clamp_concurrency(self.concurrency.get())
+        except tk.TclError:
+            return DEFAULT_CONCURRENCY
+
+    def get_bandwidth(self, value=None):
+        """读取带宽上限（MB/秒），非法内容按不限速处理"""
+        try:
+            return max(0.0, float(self.bandwidth.get() if value is None else value))
+        except (TypeError, ValueError):
+            return 0.0
+
+    def on_closing(self):
+        """窗口关闭时保存配置"""
+        self.save_config()
+        self.root.destroy()
+
+    def setup_larger_font_ui(self):
+        """设置大字体UI界面"""
+        # 主容器
+        main_frame = ctk.CTkFrame(self.root, corner_radius=0)
+        main_frame.pack(fill="both", expand=True, padx=15, pady=15)
+
+        # 标题区域
+        self.create_larger_font_header(main_frame)
+
+        # 主要内容区域
+        content_frame = ctk.CTkFrame(main_frame, fg_color="transparent")
+        content_frame.pack(fill="both", expand=True, pady=(10, 0))
+
+        # 左侧配置区域
+        self.create_config_section(content_frame)
+
+        # 右侧选项和控制区域
+        self.create_options_control_section(content_frame)
+
+        # 底部进度和结果区域
+        self.create_bottom_section(main_frame)
+
+    def create_larger_font_header(self, parent):
+        """创建大字体标题区域"""
+        header_frame = ctk.CTkFrame(parent, height=65, corner_radius=10)  # 增大高度
+        header_frame.pack(fill="x", pady=(0, 10))
+        header_frame.pack_propagate(False)
+
+        title_label = ctk.CTkLabel(
+            header_frame,
+            text="Giphy下载器",
+            font=self.create_font(self.font_size + 6)  # 从+5增大到+6
+        )
+        title_label.pack(expand=True)
+
+    def create_config_section(self, parent):
+        """创建左侧配置区域"""
+        left_frame = ctk.CTkFrame(parent, corner_radius=10)
+        left_frame.pack(side="left", fill="both", expand=True, padx=(0, 8))
+
+        # 配置标题 - 增大字体
+        config_label = ctk.CTkLabel(
+            left_frame,
+            text="🔑 配置设置",
+            font=self.create_font(self.font_size + 2)  # 从+1增大到+2
+        )
+        config_label.pack(pady=(15, 10))
+
+        # API密钥
+        api_frame = ctk.CTkFrame(left_frame, fg_color="transparent")
+        api_frame.pack(fill="x", padx=15, pady=(0, 8))
+
+        ctk.CTkLabel(
+            api_frame, 
+            text="API密钥:",
+            anchor="w", 
+            font=self.create_font(self.font_size + 1)  # 从基础字体增大到+1
+        ).pack(fill="x")
+
+        api_input_frame = ctk.CTkFrame(api_frame, fg_color="transparent")
+        api_input_frame.pack(fill="x", pady=(3, 0))
+
+        self.api_entry = ctk.CTkEntry(
+            api_input_frame,
+            textvariable=self.api_key,
+            placeholder_text="请输入GIPHY API密钥",
+            height=34,  # 从30增大到34
+            font=self.create_font(self.font_size),  # 从-1增大到基础字体
+            show="*"
+        )
+        self.api_entry.pack(side="left", fill="x", expand=True, padx=(0, 5))
+
+        # API保存状态指示
+        self.api_status = ctk.CTkLabel(
+            api_input_frame,
+            text="💾" if self.api_key.get() else "❌",
+            width=30,  # 从25增大到30
+            font=self.create_font(self.font_size + 2)  # 从+1增大到+2
+        )
+        self.api_status.pack(side="right")
+
+        # 绑定API输入变化事件
+        self.api_key.trace_add("write", self.on_api_change)
+
+        # 作者用户名
+        author_frame = ctk.CTkFrame(left_frame, fg_color="transparent")
+        author_frame.pack(fill="x", padx=15, pady=(0, 8))
+
+        ctk.CTkLabel(
+            author_frame, 
+            text="用户名:",
+            anchor="w", 
+            font=self.create_font(self.font_size + 1)  # 增大字体
+        ).pack(fill="x")
+
+        self.author_entry = ctk.CTkEntry(
+            author_frame,
+            textvariable=self.author_name,
+            placeholder_text="输入作者用户名，多个用逗号分隔",
+            height=34,  # 增大高度
+            font=self.create_font(self.font_size)  # 增大字体
+        )
+        self.author_entry.pack(fill="x", pady=(3, 0))
+
+        # 下载路径
+        path_frame = ctk.CTkFrame(left_frame, fg_color="transparent")
+        path_frame.pack(fill="x", padx=15, pady=(0, 8))
+
+        ctk.CTkLabel(
+            path_frame, 
+            text="保存路径:",
+            anchor="w", 
+            font=self.create_font(self.font_size + 1)  # 增大字体
+        ).pack(fill="x")
+
+        path_input_frame = ctk.CTkFrame(path_frame, fg_color="transparent")
+        path_input_frame.pack(fill="x", pady=(3, 0))
+
+        self.path_entry = ctk.CTkEntry(
+            path_input_frame,
+            textvariable=self.download_path,
+            height=34,  # 增大高度
+            font=self.create_font(self.font_size - 1)  # 从-2增大到-1
+        )
+        self.path_entry.pack(side="left", fill="x", expand=True, padx=(0, 5))
+
+        browse_btn = ctk.CTkButton(
+            path_input_frame,
+            text="📁",
+            width=34,  # 从30增大到34
+            height=34,
+            font=self.create_font(self.font_size),  # 从-1增大到基础字体
+            command=self.browse_folder
+        )
+        browse_btn.pack(side="right")
+
+        # 增量同步
+        self.incremental_checkbox = ctk.CTkCheckBox(
+            left_frame,
+            text="增量同步（只下载新内容）",
+            variable=self.incremental,
+            font=self.create_font(self.font_size),
+            command=self.save_config
+        )
+        self.incremental_checkbox.pack(fill="x", padx=15, pady=(0, 8))
+
+        # 继续上次中断的任务（只对本次生效，不保存到配置）
+        self.resume_checkbox = ctk.CTkCheckBox(
+            left_frame,
+            text="继续上次中断的下载（不重新搜索）",
+            variable=self.resume,
+            font=self.create_font(self.font_size)
+        )
+        self.resume_checkbox.pack(fill="x", padx=15, pady=(0, 15))
+
+    def create_options_control_section(self, parent):
+        """创建右侧选项和控制区域"""
+        right_frame = ctk.CTkFrame(parent, corner_radius=10)
+        right_frame.pack(side="right", fill="both", expand=True, padx=(8, 0))
+
+        # 选项标题 - 增大字体
+        options_label = ctk.CTkLabel(
+            right_frame,
+            text="⚙️ 下载选项",
+            font=self.create_font(self.font_size + 2)  # 从+1增大到+2
+        )
+        options_label.pack(pady=(15, 10))
+
+        # 内容类型选择
+        type_frame = ctk.CTkFrame(right_frame, fg_color="transparent")
+        type_frame.pack(fill="x", padx=15, pady=(0, 8))
+
+        ctk.CTkLabel(
+            type_frame, 
+            text="内容类型:",
+            anchor="w", 
+            font=self.create_font(self.font_size + 1)  # 增大字体
+        ).pack(fill="x")
+
+        checkbox_frame = ctk.CTkFrame(type_frame, fg_color="transparent")
+        checkbox_frame.pack(fill="x", pady=(3, 0))
+
+        self.gif_checkbox = ctk.CTkCheckBox(
+            checkbox_frame,
+            text="GIF动图",
+            variable=self.download_gifs,
+            font=self.create_font(self.font_size),  # 从-1增大到基础字体
+            width=85  # 稍微增大宽度
+        )
+        self.gif_checkbox.pack(side="left")
+
+        self.sticker_checkbox = ctk.CTkCheckBox(
+            checkbox_frame,
+            text="贴纸",
+            variable=self.download_stickers,
+            font=self.create_font(self.font_size),  # 从-1增大到基础字体
+            width=70  # 稍微增大宽度
+        )
+        self.sticker_checkbox.pack(side="left", padx=(10, 0))
+
+        # 画质选择
+        quality_frame = ctk.CTkFrame(right_frame, fg_color="transparent")
+        quality_frame.pack(fill="x", padx=15, pady=(0, 15))
+
+        ctk.CTkLabel(
+            quality_frame, 
+            text="画质:",
+            anchor="w", 
+            font=self.create_font(self.font_size + 1)  # 增大字体
+        ).pack(fill="x")
+
+        self.quality_menu = ctk.CTkOptionMenu(
+            quality_frame,
+            variable=self.quality_option,
+            values=list(self.quality_mapping.keys()),
+            height=34,  # 从30增大到34
+            font=self.create_font(self.font_size),  # 从-1增大到基础字体
+            command=self.on_quality_change
+        )
+        self.quality_menu.pack(fill="x", pady=(3, 0))
+
+        # 并发数选择
+        concurrency_frame = ctk.CTkFrame(right_frame, fg_color="transparent")
+        concurrency_frame.pack(fill="x", padx=15, pady=(0, 15))
+
+        ctk.CTkLabel(
+            concurrency_frame,
+            text="并发数:",
+            anchor="w",
+            font=self.create_font(self.font_size + 1)
+        ).pack(side="left")
+
+        ctk.CTkButton(
+            concurrency_frame,
+            text="+",
+            width=34,
+            height=34,
+            font=self.create_font(self.font_size),
+            command=lambda: self.step_concurrency(1)
+        ).pack(side="right")
+
+        self.concurrency_entry = ctk.CTkEntry(
+            concurrency_frame,
+            textvariable=self.concurrency,
+            width=50,
+            height=34,
+            justify="center",
+            font=self.create_font(self.font_size)
+        )
+        self.concurrency_entry.pack(side="right", padx=5)
+        self.concurrency_entry.bind("<FocusOut>", lambda event: self.step_concurrency(0))
+
+        ctk.CTkButton(
+            concurrency_frame,
+            text="-",
+            width=34,
+            height=34,
+            font=self.create_font(self.font_size),
+            command=lambda: self.step_concurrency(-1)
+        ).pack(side="right")
+
+        # 带宽上限，下载过程中修改立即生效
+        bandwidth_frame = ctk.CTkFrame(right_frame, fg_color="transparent")
+        bandwidth_frame.pack(fill="x", padx=15, pady=(0, 15))
+
+        ctk.CTkLabel(
+            bandwidth_frame,
+            text="限速 MB/s (0不限):",
+            anchor="w",
+            font=self.create_font(self.font_size + 1)
+        ).pack(side="left")
+
+        self.bandwidth_entry = ctk.CTkEntry(
+            bandwidth_frame,
+            textvariable=self.bandwidth,
+            width=60,
+            height=34,
+            justify="center",
+            font=self.create_font(self.font_size)
+        )
+        self.bandwidth_entry.pack(side="right")
+        self.bandwidth_entry.bind("<FocusOut>", self.on_bandwidth_change)
+        self.bandwidth_entry.bind("<Return>", self.on_bandwidth_change)
+
+        # 下载顺序
+        schedule_frame = ctk.CTkFrame(right_frame, fg_color="transparent")
+        schedule_frame.pack(fill="x", padx=15, pady=(0, 15))
+
+        ctk.CTkLabel(
+            schedule_frame,
+            text="下载顺序:",
+            anchor="w",
+            font=self.create_font(self.font_size + 1)
+        ).pack(fill="x")
+
+        self.schedule_menu = ctk.CTkOptionMenu(
+            schedule_frame,
+            variable=self.schedule_option,
+            values=list(SCHEDULE_LABELS.values()),
+            height=34,
+            font=self.create_font(self.font_size),
+            command=self.on_schedule_change
+        )
+        self.schedule_menu.pack(fill="x", pady=(3, 0))
+
+        # 控制按钮区域
+        control_frame = ctk.CTkFrame(right_frame, fg_color="transparent")
+        control_frame.pack(fill="x", padx=15, pady=(0, 15))
+
+        self.start_btn = ctk.CTkButton(
+            control_frame,
+            text="🚀 开始下载",
+            height=42,  # 从38增大到42
+            font=self.create_font(self.font_size + 1),  # 从基础字体增大到+1
+            command=self.start_download
+        )
+        self.start_btn.pack(fill="x", pady=(0, 8))
+
+        self.stop_btn = ctk.CTkButton(
+            control_frame,
+            text="⏹️ 停止",
+            height=36,  # 从32增大到36
+            font=self.create_font(self.font_size),  # 从-1增大到基础字体
+            command=self.stop_download,
+            state="disabled",
+            fg_color="red",
+            hover_color="darkred"
+        )
+        self.stop_btn.pack(fill="x")
+
+    def create_bottom_section(self, parent):
+        """创建底部进度和结果区域"""
+        bottom_frame = ctk.CTkFrame(parent, corner_radius=10)
+        bottom_frame.pack(fill="both", expand=True, pady=(10, 0))
+
+        # 进度区域
+        progress_frame = ctk.CTkFrame(bottom_frame, fg_color="transparent")
+        progress_frame.pack(fill="x", padx=15, pady=(15, 10))
+
+        # 状态和进度在同一行
+        status_progress_frame = ctk.CTkFrame(progress_frame, fg_color="transparent")
+        status_progress_frame.pack(fill="x")
+
+        self.progress_var = tk.StringVar(value="准备就绪")
+        self.status_label = ctk.CTkLabel(
+            status_progress_frame,
+            textvariable=self.progress_var,
+            font=self.create_font(self.font_size),  # 从-1增大到基础字体
+            anchor="w"
+        )
+        self.status_label.pack(side="left", fill="x", expand=True)
+
+        self.progress_bar = ctk.CTkProgressBar(
+            status_progress_frame,
+            width=150,
+            height=8  # 保持进度条高度
+        )
+        self.progress_bar.pack(side="right", padx=(10, 0))
+        self.progress_bar.set(0)
+
+        # 日志和已下载文件的预览分为两个标签页
+        self.bottom_tabs = ctk.CTkTabview(bottom_frame, height=160, command=self.refresh_gallery)
+        self.bottom_tabs.pack(fill="both", expand=True, padx=15, pady=(0, 15))
+        log_tab = self.bottom_tabs.add(LOG_TAB)
+        gallery_tab = self.bottom_tabs.add(GALLERY_TAB)
+
+        # 结果显示区域
+        self.result_text = ctk.CTkTextbox(
+            log_tab,
+            height=120,  # 保持高度
+            corner_radius=8,
+            font=self.create_font(self.font_size - 1, self.code_font_family),  # 从-2增大到-1
+            wrap="word"
+        )
+        self.result_text.pack(fill="both", expand=True)
+
+        # 预览区只为可见的格子创建元素，缩略图在后台线程解码
+        self.gallery = ThumbnailGallery(
+            gallery_tab,
+            cache_mb=float(self.settings['gallery_cache_mb']),
+            font=(self.ui_font_family, self.font_size - 2)
+        )
+        self.gallery.pack(fill="both", expand=True)
+
+    def on_api_change(self, *args):
+        """API输入变化时更新状态指示器"""
+        if self.api_key.get().strip():
+            self.api_status.configure(text="💾")
+            # 实时保存API密钥
+            self.save_config()
+        else:
+            self.api_status.configure(text="❌")
+
+    def on_quality_change(self, value):
+        """画质选择变化时保存配置"""
+        self.save_config()
+
+    def on_bandwidth_change(self, event=None):
+        """应用新的带宽上限：保存配置，正在下载时立即生效"""
+        value = self.get_bandwidth()
+        self.bandwidth.set(f"{value:g}")
+        if value == self.settings['bandwidth_mb']:
+            return
+        self.settings['bandwidth_mb'] = value
+        if self.engine and self.engine.is_downloading:
+            self.engine.set_bandwidth(value)
+            self.log_message(f"🚦 带宽上限已调整为 {f'{value:g} MB/s' if value else '不限速'}")
+        self.save_config()
+
+    def on_schedule_change(self, value):
+        """下载顺序变化时保存配置，从下一次下载开始生效"""
+        self.settings['schedule'] = next(key for key, label in SCHEDULE_LABELS.items() if label == value)
+        self.save_config()
+
+    def step_concurrency(self, delta):
+        """调整并发数并保存配置"""
+        self.concurrency.set(clamp_concurrency(self.get_concurrency() + delta))
+        self.save_config()
+
+    def browse_folder(self):
+        """浏览文件夹"""
+        folder = filedialog.askdirectory(initialdir=self.download_path.get())
+        if folder:
+            self.download_path.set(folder)
+            self.save_config()
+            self.refresh_gallery()
+
+    def refresh_gallery(self):
+        """预览标签页可见且下载目录变化时重新扫描"""
+        if self.bottom_tabs.get() != GALLERY_TAB:
+            return
+        download_path = self.download_path.get()
+        if self.gallery.root_dir != download_path:
+            self.gallery.load_directory(download_path)
+
+    def file_downloaded(self, filepath):
+        """文件下载完成（可在任意线程调用）"""
+        self.ui_queue.put(('file', filepath))
+
+    def log_message(self, message):
+        """添加日志消息（可在任意线程调用）"""
+        timestamp = time.strftime('%H:%M:%S')
+        self.ui_queue.put(('log', f"[{timestamp}] {message}\n"))
+
+    def set_status(self, text):
+        """更新状态文字（可在任意线程调用）"""
+        self.ui_queue.put(('status', text))
+
+    def set_progress(self, value):
+        """更新进度条（可在任意线程调用）"""
+        self.ui_queue.put(('progress', value))
+
+    def set_running(self, running):
+        """切换开始/停止按钮状态（可在任意线程调用）"""
+        self.ui_queue.put(('running', running))
+
+    def process_ui_queue(self):
+        """在主线程中一次性应用队列里积累的界面更新，状态与进度只取最新值"""
+        lines = []
+        files = []
+        latest = {}
+        try:
+            while True:
+                kind, value = self.ui_queue.get_nowait()
+                if kind == 'log':
+                    lines.append(value)
+                elif kind == 'file':
+                    files.append(value)
+                else:
+                    latest[kind] = value
+        except queue.Empty:
+            pass
+
+        if lines:
+            self.append_log_lines(lines)
+        if files:
+            self.gallery.add_paths(files)
+        if 'status' in latest:
+            self.progress_var.set(latest['status'])
+        if 'progress' in latest:
+            self.progress_bar.set(latest['progress'])
+        if 'running' in latest:
+            self.start_btn.configure(state="disabled" if latest['running'] else "normal")
+            self.stop_btn.configure(state="normal" if latest['running'] else "disabled")
+
+        self.root.after(UI_REFRESH_MS, self.process_ui_queue)
+
+    def append_log_lines(self, lines):
+        """把一批日志追加到文本框，超出上限时删除最早的行（环形缓冲）"""
+        max_lines = max(1, int(self.settings['log_max_lines']))
+        lines = lines[-max_lines:]
+        self.result_text.insert("end", "".join(lines))
+        self.log_line_count += sum(line.count("\n") for line in lines)
+
+        overflow = self.log_line_count - max_lines
+        if overflow > 0:
+            self.result_text.delete("1.0", f"{overflow + 1}.0")
+            self.log_line_count -= overflow
+        self.result_text.see("end")
+
+    def start_download(self):
+        """开始下载"""
+        if not self.api_key.get().strip():
+            messagebox.showerror("错误", "请输入GIPHY API密钥")
+            return
+
+        if not parse_usernames(self.author_name.get()):
+            messagebox.showerror("错误", "请输入作者用户名")
+            return
+
+        if not (self.download_gifs.get() or self.download_stickers.get()):
+            messagebox.showerror("错误", "请至少选择一种内容类型")
+            return
+
+        # 保存当前配置
+        self.save_config()
+        self.refresh_gallery()
+
+        # 更新界面状态
+        self.start_btn.configure(state="disabled")
+        self.stop_btn.configure(state="normal")
+        self.progress_bar.set(0)
+        self.result_text.delete("1.0", "end")
+        self.log_line_count = 0
+
+        # 在主线程中读取好所有选项，下载线程不再访问Tk变量
+        self.engine = GiphyEngine(
+            self.api_key.get().strip(),
+            self.settings,
+            self.get_concurrency(),
+            log=self.log_message,
+            status=self.set_status,
+            progress=self.set_progress,
+            downloaded=self.file_downloaded
+        )
+        content_types = [
+            content_type
+            for content_type, enabled in (('gifs', self.download_gifs), ('stickers', self.download_stickers))
+            if enabled.get()
+        ]
+        job_args = (
+            parse_usernames(self.author_name.get()),
+            self.download_path.get(),
+            self.quality_option.get(),
+            content_types,
+            self.incremental.get(),
+            self.resume.get()
+        )
+
+        # 启动下载线程
+        self.download_thread = threading.Thread(target=self.download_content, args=(self.engine, job_args))
+        self.download_thread.daemon = True
+        self.download_thread.start()
+
+    def download_content(self, engine, job_args):
+        """下载线程：运行引擎，结束后恢复按钮状态"""
+        try:
+            engine.run_batch(*job_args)
+        except Exception as e:
+            self.log_message(f"❌ 下载出错: {str(e)}")
+        finally:
+            self.set_running(False)
+
+    def stop_download(self):
+        """停止下载"""
+        if self.engine:
+            self.engine.cancel()
+        self.start_btn.configure(state="normal")
+        self.stop_btn.configure(state="disabled")
+        self.progress_var.set("已停止")
+        self.log_message("❌ 下载已停止")
+
+    def run(self):
+        """运行应用程序"""
+        self.root.mainloop()